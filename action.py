@@ -1,29 +1,148 @@
 # Python imports
-from hashlib import shake_128
+from hashlib import shake_128, sha256
+from functools import wraps
+from time import perf_counter
 
 # SageMath imports
 from sage.all import randint, ZZ, factor, proof
 from sage.categories.action import Action
 
+from general_purpose import PRG, to_bytes
+from cache import CACHE
+
+
+# methods of the actions counted and timed by ActionStats
+INSTRUMENTED = ('act', 'rand_group', 'rand_set')
+
+class ActionStats():
+    """
+    Number of calls and total time (seconds) spent in the instrumented
+    methods of an action. Every process has its own copy of the action,
+    so calls made in worker processes are not counted here.
+    """
+    __slots__ = ('calls', 'seconds')
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.calls = dict.fromkeys(INSTRUMENTED, 0)
+        self.seconds = dict.fromkeys(INSTRUMENTED, 0.0)
+
+    def record(self, name, elapsed):
+        self.calls[name] += 1
+        self.seconds[name] += elapsed
+
+    def as_dict(self):
+        return {name : {'calls' : self.calls[name], 'seconds' : self.seconds[name]} for name in INSTRUMENTED}
+
+    def __repr__(self):
+        return ', '.join(f'{name}: {self.calls[name]} calls in {self.seconds[name]:.3f} s' for name in INSTRUMENTED)
+
+def instrument(name, method):
+    # wraps method so that its calls are recorded in self.stats
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        if not self.instrumented:
+            return method(self, *args, **kwargs)
+        start = perf_counter()
+        try:
+            return method(self, *args, **kwargs)
+        finally:
+            self.stats.record(name, perf_counter() - start)
+    wrapper.__wrapped_name__ = name
+    return wrapper
+
+
+def sample_enumerated(parent, prg):
+    """
+    Uniform element of a finite sage parent supporting `unrank` (e.g. a
+    finite field or a permutation group), drawn from prg without touching
+    the global sage randomness.
+    """
+    if not hasattr(parent, 'unrank'):
+        raise NotImplementedError(f'{parent} can not be sampled from a PRG, override rand_set and rand_group')
+    return parent.unrank(prg.randint_mod(int(parent.cardinality())))
 
 
 class CryptoAction(Action):
+    # set to False (on the class or on an instance) to turn the counters off
+    instrumented = True
+
     def __init__(self,G,S,security,is_left=True):
         super().__init__(G,S,is_left = is_left)
         self.security = security
+        self.stats = ActionStats()
+        self._set_cost = None
+        self._group_cost = None
+
+    def __init_subclass__(cls, **kwargs):
+        # the overrides of act, rand_group and rand_set are instrumented too
+        super().__init_subclass__(**kwargs)
+        for name in INSTRUMENTED:
+            method = cls.__dict__.get(name)
+            if method is not None and getattr(method, '__wrapped_name__', None) != name:
+                setattr(cls, name, instrument(name, method))
+
+    def prg(self, SEED = None):
+        """
+        Returns the SHAKE based PRG expanding SEED, concrete actions should
+        sample their elements from it.
+        """
+        return PRG(SEED, lam = self.security)
 
     def rand_set(self, SEED = None):
-        with seed(SEED): return (self.domain()).random_element()
+        # generic fallback for finite enumerated domains: uniform rank drawn from the PRG
+        return sample_enumerated(self.domain(), self.prg(SEED))
+    rand_set = instrument('rand_set', rand_set)
 
     def rand_group(self, SEED = None):
-        with seed(SEED): return (self.actor()).random_element()
+        # generic fallback for finite enumerated groups: uniform rank drawn from the PRG
+        return sample_enumerated(self.actor(), self.prg(SEED))
+    rand_group = instrument('rand_group', rand_group)
+
+    def cache_key(self):
+        """
+        Parameters identifying the action (and its elements) in the cache.
+        """
+        return (type(self).__name__,) + tuple(getattr(self, p, None) for p in ('n', 'k', 'm', 'q')) + (self.security,)
 
     def origin(self):
-        return self.rand_set(SEED = 1)
+        # memoized process-wide (see cache.py), the origin only depends on the parameters
+        return CACHE.get(self, ('origin', 1), lambda: self.rand_set(SEED = 1))
+
+    def public_key_from_bytes(self, data):
+        """
+        Set element serialized in data (with `to_bytes`), memoized
+        process-wide so that each public key is parsed only once.
+        """
+        data = bytes(data)
+        # parsing is cheap with respect to reading from disk, only kept in memory
+        return CACHE.get(self, ('public_key', sha256(data).digest()), lambda: self.set_from_bytes(data), persist = False)
+
+    def set_from_bytes(self, data):
+        raise NotImplementedError('the action does not parse its set elements')
+
+    def group_from_bytes(self, data):
+        raise NotImplementedError('the action does not parse its group elements')
 
     def set_costs(self):
-        pass
+        """
+        Size in bytes of the serialization (`to_bytes`) of a set element,
+        measured on a sampled one (not counted in `stats`).
+        """
+        if self._set_cost is None:
+            element = type(self).rand_set.__wrapped__(self, SEED = 1)
+            self._set_cost = len(to_bytes(element, lam = self.security))
+        return self._set_cost
 
     def group_costs(self):
-        pass
+        """
+        Size in bytes of the serialization (`to_bytes`) of a group element,
+        measured on a sampled one (not counted in `stats`).
+        """
+        if self._group_cost is None:
+            element = type(self).rand_group.__wrapped__(self, SEED = 1)
+            self._group_cost = len(to_bytes(element, lam = self.security))
+        return self._group_cost
 
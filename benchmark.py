@@ -0,0 +1,289 @@
+# Python imports
+from argparse import ArgumentParser
+from time import perf_counter, time
+from statistics import median
+import json
+import os
+import platform
+import subprocess
+import tracemalloc
+
+import numpy as np
+
+from sage.matrix.constructor import matrix
+
+from grass import GRASS
+from linear_equivalence import LCE, SF
+from matrix_code_equivalence import MCE
+from general_purpose import MerkleTree, SeedTree, cmt
+
+
+# Named parameter sets: code sizes and weight from the round 1 specifications.
+# GRASS counts the public keys besides the origin, so num_public_keys is s - 1
+# for a specification with s codes. t is the number of rounds GRASS computes
+# for lam, checked when the scheme is built: it is the one of the specification
+# for LESS, while MEDS rounds it up (to the value in the comment).
+PARAMETER_SETS = {
+    'toy-LCE' : dict(action = 'LCE', n = 32, k = 16, q = 127, num_public_keys = 2, w = 16, t = 63, lam = 64),
+    'toy-MCE' : dict(action = 'MCE', n = 6, m = 6, k = 6, q = 127, num_public_keys = 2, w = 16, t = 63, lam = 64),
+    'LESS-1b' : dict(action = 'LCE', n = 252, k = 126, q = 127, num_public_keys = 1, w = 30, t = 247, lam = 128),
+    'LESS-1i' : dict(action = 'LCE', n = 252, k = 126, q = 127, num_public_keys = 3, w = 20, t = 244, lam = 128),
+    'LESS-1s' : dict(action = 'LCE', n = 252, k = 126, q = 127, num_public_keys = 7, w = 17, t = 198, lam = 128),
+    'LESS-3b' : dict(action = 'LCE', n = 400, k = 200, q = 127, num_public_keys = 1, w = 33, t = 759, lam = 192),
+    'LESS-5b' : dict(action = 'LCE', n = 548, k = 274, q = 127, num_public_keys = 1, w = 40, t = 1352, lam = 256),
+    'MEDS-9923' : dict(action = 'MCE', n = 14, m = 14, k = 14, q = 4093, num_public_keys = 3, w = 14, t = 1146, lam = 128), # 1152
+    'MEDS-13220' : dict(action = 'MCE', n = 14, m = 14, k = 14, q = 4093, num_public_keys = 4, w = 20, t = 185, lam = 128), # 192
+    'MEDS-41711' : dict(action = 'MCE', n = 22, m = 22, k = 22, q = 4093, num_public_keys = 3, w = 26, t = 601, lam = 192), # 608
+    'MEDS-134180' : dict(action = 'MCE', n = 30, m = 30, k = 30, q = 2039, num_public_keys = 4, w = 52, t = 180, lam = 256), # 192
+}
+
+
+def make_action(params):
+    """
+    Group action of a parameter set of PARAMETER_SETS.
+    """
+    if params['action'] == 'LCE':
+        return LCE(params['n'], params['k'], params['q'], security = params['lam'])
+    return MCE(params['n'], params['m'], params['k'], params['q'], security = params['lam'])
+
+def measure(fn, repeat = 5):
+    """
+    Runs fn `repeat` times for the timing, then once more tracing the
+    memory with tracemalloc.
+
+    Returns:
+    - dict: Best and median wall time (seconds), bytes still allocated after
+      the call (net) and peak of the memory allocated during the call.
+    """
+    times = []
+    for _ in range(repeat):
+        start = perf_counter()
+        fn()
+        times.append(perf_counter() - start)
+    tracemalloc.start()
+    try:
+        before, _ = tracemalloc.get_traced_memory()
+        out = fn()
+        after, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del out
+    return {
+        'best' : min(times),
+        'median' : median(times),
+        'allocated' : after - before,
+        'peak' : peak - before,
+    }
+
+def bench_parameter_set(name, repeat = 5, signature = True):
+    """
+    Measures the building blocks (action, group operations, systematic
+    form, trees, commitments) and, if `signature` is set, keygen, sign and
+    verify of GRASS with fixed weight for the parameter set `name`.
+
+    Returns:
+    - dict: Measures (see `measure`) of every benchmark.
+    """
+    params = PARAMETER_SETS[name]
+    lam = params['lam']
+    action = make_action(params)
+    scheme = GRASS(action, num_public_keys = params['num_public_keys'], fixed_weight = True, w = params['w'], lam = lam)
+    if scheme.num_rounds != params['t']:
+        raise ValueError(f"{name}: GRASS uses {scheme.num_rounds} rounds instead of {params['t']}")
+    t = scheme.num_rounds
+    origin = scheme.origin
+    g = action.rand_group(SEED = 2)
+    h = action.rand_group(SEED = 3)
+    G = matrix(action.F, origin.generator().tolist())
+    leaves = [cmt(i, lam = lam) for i in range(t)]
+
+    out = {
+        'act' : measure(lambda: action.act(g, origin), repeat),
+        'group_mul' : measure(lambda: g * h, repeat),
+        'group_inverse' : measure(lambda: g.inverse(), repeat),
+        'SF' : measure(lambda: SF(G), repeat),
+        'MerkleTree' : measure(lambda: MerkleTree(leaves, lam = lam), repeat),
+        'SeedTree' : measure(lambda: SeedTree(t, SEED = 1, lam = lam), repeat),
+        'cmt' : measure(lambda: cmt(origin, lam = lam), repeat),
+    }
+    if signature:
+        msg = b'benchmark message'
+        sk = scheme.generate_keys()
+        sig = sk.sign(msg)
+        # the end to end benchmarks are much slower, they are run fewer times
+        e2e = max(1, repeat // 5)
+        out['keygen'] = measure(scheme.generate_keys, e2e)
+        out['sign'] = measure(lambda: sk.sign(msg), e2e)
+        out['verify'] = measure(lambda: sk.verifying_key.verify(sig, msg), e2e)
+        if not sk.verifying_key.verify(sig, msg):
+            raise RuntimeError(f'valid signature rejected for {name}')
+        # fixed weight signatures have exactly the size given by the cost model
+        if len(scheme.serialize(sig)) != scheme.size()['signature']:
+            raise RuntimeError(f"{name}: signature of {len(scheme.serialize(sig))} bytes instead of {scheme.size()['signature']}")
+        # group actions counted by the action against the ones predicted by GRASS
+        counts = {}
+        for (step, fn, predicted) in [('sign', lambda: sk.sign(msg), scheme.group_actions_signing),
+                                      ('verify', lambda: sk.verifying_key.verify(sig, msg), scheme.group_actions_verify)]:
+            action.stats.reset()
+            fn()
+            counts[step] = dict(predicted = predicted, **action.stats.calls)
+        out['counts'] = counts
+    return out
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output = True, text = True, check = True,
+                              cwd = os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run_suite(names = None, repeat = 5, signature = True):
+    """
+    Runs `bench_parameter_set` for the given parameter sets (all of them
+    by default).
+
+    Returns:
+    - dict: JSON serializable results, with the commit and the platform
+      they have been obtained on.
+    """
+    names = list(PARAMETER_SETS) if names is None else names
+    return {
+        'commit' : git_revision(),
+        'time' : time(),
+        'python' : platform.python_version(),
+        'numpy' : np.__version__,
+        'machine' : platform.machine(),
+        'repeat' : repeat,
+        'results' : {name : bench_parameter_set(name, repeat, signature) for name in names},
+    }
+
+def compare(old, new, key = 'best'):
+    """
+    Ratios new/old of the measure `key` for the benchmarks in both results.
+
+    Returns:
+    - dict: {parameter set: {benchmark: ratio}}.
+    """
+    ratios = {}
+    for name, results in new['results'].items():
+        for bench, res in results.items():
+            prev = old['results'].get(name, {}).get(bench)
+            if prev and key in res and prev.get(key):
+                ratios.setdefault(name, {})[bench] = res[key] / prev[key]
+    return ratios
+
+
+def bench_verify_batch(action, num_signatures = 16, workers = None, **settings):
+    """
+    Measures the throughput of `GRASS.verify_batch`.
+
+    Parameters:
+    - action (CryptoAction): Group action used for the signature.
+    - num_signatures (int): Number of signatures verified in the batch.
+    - workers (int): Number of processes used by the verifier.
+    - settings: Further parameters for GRASS.
+
+    Returns:
+    - dict: Timing of the batch and signatures per second.
+    """
+    signer = GRASS(action, **settings)
+    signer.keygen()
+    msgs = [f'message {i}'.encode() for i in range(num_signatures)]
+    sigs = [signer.sign(msg) for msg in msgs]
+
+    verifier = GRASS(action, workers = workers, **settings)
+    verifier.pk = signer.pk
+    start = perf_counter()
+    results = verifier.verify_batch(sigs, msgs)
+    elapsed = perf_counter() - start
+    verifier.close()
+    if not all(results):
+        raise RuntimeError('valid signature rejected by verify_batch')
+    return {
+        'signatures' : num_signatures,
+        'seconds' : elapsed,
+        'signatures_per_second' : num_signatures / elapsed,
+    }
+
+
+class FailingAction():
+    """
+    Proxy of an action whose `act` fails, as for codes without systematic
+    form, on a fraction `rate` of its outputs (chosen by their digest, so
+    the signer and the verifier agree on them).
+    """
+    def __init__(self, action, rate = 0.05):
+        self.action = action
+        self.rate = rate
+
+    def act(self, g, x):
+        y = self.action.act(g, x)
+        if cmt(y, lam = 64)[0] < 256 * self.rate:
+            raise ValueError('input matrix without systematic form')
+        return y
+
+    def __getattr__(self, name):
+        return getattr(self.action, name)
+
+def check_retries(action, rate = 0.05, num_signatures = 4, lam = 32):
+    """
+    Signs and verifies (through `serialize` and `deserialize`) with an
+    action failing on some elements, in every commitment setting: the
+    round secrets replaced by the signer must be replayed by the verifier.
+    Raises RuntimeError if a valid signature is rejected.
+    """
+    action = FailingAction(action, rate)
+    for settings in [dict(), dict(fixed_weight = True, w = 8),
+                     dict(MPC = True, N = 4), dict(MPC = True, N = 4, fixed_weight = True, w = 6),
+                     dict(MPC = True, N = 4, skip = True), dict(MPC = True, N = 4, skip = True, fixed_weight = True, w = 6)]:
+        scheme = GRASS(action, num_public_keys = 2, lam = lam, **settings)
+        sk = scheme.generate_keys()
+        for i in range(num_signatures):
+            msg = f'message {i}'.encode()
+            sig = scheme.deserialize(scheme.serialize(sk.sign(msg)))
+            if not sk.verifying_key.verify(sig, msg):
+                raise RuntimeError(f'valid signature rejected with {settings}')
+
+
+if __name__ == '__main__':
+    parser = ArgumentParser(description = 'Benchmarks for GRASS: batch verification with LCE, or the suite over named parameter sets')
+    parser.add_argument('-n', type = int, default = 252)
+    parser.add_argument('-k', type = int, default = 126)
+    parser.add_argument('-q', type = int, default = 127)
+    parser.add_argument('--num-public-keys', type = int, default = 2)
+    parser.add_argument('--num-signatures', type = int, default = 16)
+    parser.add_argument('--workers', type = int, default = None)
+    parser.add_argument('--suite', nargs = '*', metavar = 'SET', choices = list(PARAMETER_SETS),
+                        help = 'run the suite on these parameter sets (all if none is given)')
+    parser.add_argument('--repeat', type = int, default = 5)
+    parser.add_argument('--no-signature', action = 'store_true', help = 'skip keygen, sign and verify in the suite')
+    parser.add_argument('--output', help = 'JSON file for the suite results')
+    parser.add_argument('--compare', metavar = 'JSON', help = 'results of a previous run to compare with')
+    parser.add_argument('--check-retries', action = 'store_true', help = 'sign and verify with an action failing on some elements')
+    args = parser.parse_args()
+    if args.check_retries:
+        check_retries(LCE(args.n, args.k, args.q))
+        print('signatures with replaced round secrets verified')
+    elif args.suite is None:
+        out = bench_verify_batch(LCE(args.n, args.k, args.q), num_signatures = args.num_signatures,
+                                 workers = args.workers, num_public_keys = args.num_public_keys)
+        print(f"{out['signatures']} signatures verified in {out['seconds']:.3f} s: {out['signatures_per_second']:.2f} signatures/s")
+    else:
+        out = run_suite(args.suite or None, repeat = args.repeat, signature = not args.no_signature)
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(out, f, indent = 1)
+        ratios = {}
+        if args.compare:
+            with open(args.compare) as f:
+                ratios = compare(json.load(f), out)
+        for name, results in out['results'].items():
+            print(name)
+            for bench, res in results.items():
+                if 'best' not in res:
+                    continue
+                ratio = ratios.get(name, {}).get(bench)
+                ratio = f'  x{ratio:.2f}' if ratio is not None else ''
+                print(f"  {bench:<14} {res['best']*1e3:10.3f} ms  peak {res['peak']/1024:10.1f} KiB{ratio}")
+            for step, counts in results.get('counts', {}).items():
+                print(f"  {step:<14} {counts['act']} actions ({counts['predicted']} predicted)")
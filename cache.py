@@ -0,0 +1,106 @@
+# Python imports
+from collections import OrderedDict
+from hashlib import sha256
+from threading import Lock
+import os
+
+
+class ElementCache():
+    """
+    Process-wide LRU cache of set elements (origins, public keys) keyed by
+    the parameters of their action, see `CryptoAction.cache_key`, and by a
+    tag (e.g. ('origin', SEED)).
+
+    Cached elements are shared, so they must be immutable (as SystematicCode
+    and MatrixCode are). If `path` is given the elements are also stored
+    there through their `to_bytes` serialization, and parsed back with
+    `action.set_from_bytes`: repeated runs skip the generation too.
+    """
+    def __init__(self, maxsize = 256, path = None):
+        self.maxsize = maxsize
+        self.path = path
+        self._data = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _file(self, key):
+        return os.path.join(self.path, sha256(repr(key).encode()).hexdigest() + '.bin')
+
+    def _load(self, action, key):
+        if self.path is None or not parses_elements(action):
+            return None
+        try:
+            with open(self._file(key), 'rb') as f:
+                data = f.read()
+            return action.set_from_bytes(data)
+        except (OSError, ValueError, NotImplementedError):
+            return None
+
+    def _store(self, action, key, element):
+        if self.path is None or not parses_elements(action) or not hasattr(element, 'to_bytes'):
+            return
+        os.makedirs(self.path, exist_ok = True)
+        name = self._file(key)
+        tmp = f'{name}.{os.getpid()}.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(element.to_bytes())
+        # atomic, so that concurrent processes never read half written files
+        os.replace(tmp, name)
+
+    def get(self, action, tag, factory, persist = True):
+        """
+        Element of `action` identified by `tag`, computed with factory() (and
+        stored on disk if `persist` is set) only if it is neither in memory
+        nor on disk.
+        """
+        key = action.cache_key() + tag
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+        element = self._load(action, key) if persist else None
+        if element is None:
+            element = factory()
+            if persist:
+                self._store(action, key, element)
+        with self._lock:
+            self.misses += 1
+            self._data[key] = element
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last = False)
+        return element
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        return len(self._data)
+
+
+def parses_elements(action):
+    """
+    Whether action overrides `CryptoAction.set_from_bytes` (which only
+    raises), so that its elements can be persisted.
+    """
+    # imported here, action.py imports this module
+    from action import CryptoAction
+    return getattr(type(action), 'set_from_bytes', CryptoAction.set_from_bytes) is not CryptoAction.set_from_bytes
+
+
+CACHE = ElementCache(path = os.environ.get('GRASS_CACHE_DIR'))
+
+def configure(maxsize = None, path = None):
+    """
+    Changes the size of the process-wide cache and the directory where the
+    elements are persisted (by default the environment variable GRASS_CACHE_DIR).
+    """
+    if maxsize is not None:
+        CACHE.maxsize = maxsize
+    if path is not None:
+        CACHE.path = path
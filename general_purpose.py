@@ -1,15 +1,120 @@
 # Python imports
 from hashlib import shake_128
-from sage.all import Integer
+from sage.all import Integer, ZZ
 from math import ceil, log
-
-
+from os import urandom
+import numpy as np
+
+from prime_field import is_invertible
+
+
+
+def bit_length(q):
+    """
+    Number of bits needed to store an integer in range(q).
+    """
+    return max(int(q - 1).bit_length(), 1)
+
+def pack_ints(values, bits):
+    """
+    Packs non negative integers smaller than 2**bits into a bytes string,
+    using exactly `bits` bits per entry (little endian).
+    """
+    values = np.asarray(values, dtype=np.uint64).ravel()
+    if bits in (8, 16, 32, 64):
+        return values.astype(f'<u{bits // 8}').tobytes()
+    bit_array = ((values[:, None] >> np.arange(bits, dtype=np.uint64)) & 1).astype(np.uint8)
+    return np.packbits(bit_array, bitorder='little').tobytes()
+
+def unpack_ints(data, bits, count):
+    """
+    Inverse of `pack_ints`, returns a numpy array with `count` entries.
+    Raises ValueError if the padding bits after the last entry are not
+    zero, so that every array has a single encoding.
+    """
+    if bits in (8, 16, 32, 64):
+        return np.frombuffer(data, dtype=f'<u{bits // 8}', count=count).astype(np.int64)
+    bit_array = np.unpackbits(np.frombuffer(data, dtype=np.uint8), bitorder='little')
+    if bit_array[count*bits:].any():
+        raise ValueError('non-zero padding bits')
+    bit_array = bit_array[:count*bits]
+    weights = np.left_shift(np.int64(1), np.arange(bits, dtype=np.int64))
+    return bit_array.reshape(count, bits).astype(np.int64) @ weights
+
+def to_bytes(input, lam = 128):
+    """
+    Canonical binary serialization of the objects we commit to.
+
+    Set and group elements (and in general every object used in a
+    commitment) should expose a `to_bytes()` method; integers are
+    encoded on `ceil(lam/8)` bytes (or more if needed) and lists/tuples
+    are encoded as the length prefixed concatenation of their entries.
+    Objects without the hook fall back on `str`.
+    """
+    if isinstance(input, (bytes, bytearray, memoryview)):
+        return bytes(input)
+    elif isinstance(input, str):
+        return input.encode()
+    elif isinstance(input, (int, Integer)):
+        input = int(input)
+        length = max(ceil(lam/8), (input.bit_length() + 7) // 8)
+        return input.to_bytes(length, 'big')
+    elif isinstance(input, (list, tuple)):
+        buff = []
+        for x in input:
+            x = to_bytes(x, lam = lam)
+            buff.append(len(x).to_bytes(4, 'little'))
+            buff.append(x)
+        return b''.join(buff)
+    elif hasattr(input, 'to_bytes'):
+        return input.to_bytes()
+    else:
+        return str(input).encode()
 
 def cmt(input, lam = 128):
-    return to_hex(Integer(int.from_bytes(shake_128(str.encode(str(input))).digest(ceil(lam/8)))),lam = lam)
+    """
+    Commitment to `input`, returns the raw digest of `lam` bits.
+    Use `to_hex` to obtain the hexadecimal representation.
+    """
+    return shake_128(to_bytes(input, lam = lam)).digest(ceil(lam/8))
+
+def hash_message(prefix, msg, lam = 128, chunk_size = 1 << 16):
+    """
+    Digest of `lam` bits of prefix || msg, absorbing the message
+    incrementally so that it is never copied or held in memory at once.
+
+    The message can be bytes or str, any object exposing the buffer protocol
+    (e.g. a memory-mapped file, hashed in place), a file object (read in
+    chunks of `chunk_size` bytes or characters) or an iterator of chunks;
+    other objects are serialized with `to_bytes`. Text chunks are encoded
+    in UTF-8 as str messages, so the same bytes give the same digest
+    whatever the way they are provided.
+    """
+    h = shake_128(b'\x04' + to_bytes(prefix, lam = lam))
+    if isinstance(msg, str):
+        h.update(msg.encode())
+        return h.digest(ceil(lam/8))
+    try:
+        h.update(memoryview(msg))
+        return h.digest(ceil(lam/8))
+    except TypeError:
+        pass
+    if hasattr(msg, 'read'):
+        chunk = msg.read(chunk_size)
+        while chunk:
+            h.update(chunk.encode() if isinstance(chunk, str) else chunk)
+            chunk = msg.read(chunk_size)
+    elif hasattr(msg, '__iter__') and not isinstance(msg, (list, tuple)):
+        for chunk in msg:
+            h.update(chunk.encode() if isinstance(chunk, str) else chunk)
+    else:
+        h.update(to_bytes(msg, lam = lam))
+    return h.digest(ceil(lam/8))
 
 def to_hex(input, lam = 128):
-    if input in ZZ:
+    if isinstance(input, (bytes, bytearray)):
+        return bytes(input).hex()
+    elif input in ZZ:
         return Integer(input).hex().rjust(2*ceil(lam/8), '0')
     elif set(input) <= {'0', '1', '2', '3', '4', '5', '6', '7', '8', '9', 'a', 'b', 'c', 'd', 'e', 'f'}:
         return input
@@ -17,232 +122,643 @@ def to_hex(input, lam = 128):
         raise ValueError('Input entry not integer of hexadecimal')
 
 def to_int(input):
-    if input in ZZ:
+    if isinstance(input, (bytes, bytearray)):
+        return Integer(int.from_bytes(input, 'big'))
+    elif input in ZZ:
         return input 
     else:
         return ZZ('0x' + input)
 
+def seed_to_bytes(SEED, lam = 128):
+    """
+    Converts a seed given as integer, hexadecimal string or bytes
+    into a bytes string of ceil(lam/8) bytes.
+    """
+    if isinstance(SEED, (bytes, bytearray, memoryview)):
+        return bytes(SEED)
+    elif isinstance(SEED, str):
+        return bytes.fromhex(SEED.rjust(2*ceil(lam/8), '0'))
+    else:
+        return to_bytes(SEED, lam = lam)
+
 # memo for HEX -> int do s -> ZZ('0x'+s)
 
+
+class PRG():
+    """
+    Deterministic pseudorandom generator expanding a seed with SHAKE.
+
+    The seed (and the optional salt) is absorbed once, then the stream is
+    produced in counter mode by copies of that state. Every instance keeps
+    its own state, so it is safe to use one PRG per thread, and the output
+    only depends on the seed (not on the SageMath version or on its global
+    randomness). With `SEED = None` a fresh seed is drawn from the OS.
+    """
+    BLOCK = 168
+
+    def __init__(self, SEED = None, SALT = b'', lam = 128):
+        self.lam = lam
+        if SEED is None:
+            SEED = urandom(ceil(lam/8))
+        self._state = shake_128(b'\x03' + to_bytes(SALT, lam = lam) + b'\x00' + seed_to_bytes(SEED, lam = lam))
+        self._counter = 0
+        self._buffer = b''
+        self._pos = 0
+
+    def read(self, length):
+        """
+        Returns the next `length` bytes of the stream.
+        """
+        out = bytearray()
+        while len(out) < length:
+            if self._pos == len(self._buffer):
+                h = self._state.copy()
+                h.update(self._counter.to_bytes(8, 'little'))
+                self._counter += 1
+                self._buffer = h.digest(self.BLOCK)
+                self._pos = 0
+            take = min(length - len(out), self.BLOCK - self._pos)
+            out += self._buffer[self._pos:self._pos + take]
+            self._pos += take
+        return bytes(out)
+
+    def randbits(self, bits):
+        return int.from_bytes(self.read((bits + 7) // 8), 'little') & ((1 << bits) - 1)
+
+    def randint_mod(self, q):
+        """
+        Uniform integer in range(q) by rejection sampling.
+        """
+        bits = bit_length(q)
+        while True:
+            x = self.randbits(bits)
+            if x < q:
+                return x
+
+    def randint(self, a, b):
+        """
+        Uniform integer between a and b (both included), as sage `randint`.
+        """
+        return a + self.randint_mod(b - a + 1)
+
+    def vector_mod(self, length, q, nonzero = False):
+        """
+        Numpy array of `length` uniform entries in range(q),
+        or in range(1, q) when `nonzero` is set.
+        """
+        low = 1 if nonzero else 0
+        bits = bit_length(q - low)
+        size = 1 if bits <= 8 else 2 if bits <= 16 else 4 if bits <= 32 else 8
+        mask = (1 << bits) - 1
+        out = np.empty(0, dtype = np.int64)
+        while len(out) < length:
+            missing = length - len(out)
+            # oversample a bit to avoid a second round most of the times
+            count = missing + missing // 2 + 8
+            x = np.frombuffer(self.read(count * size), dtype = f'<u{size}').astype(np.int64) & mask
+            out = np.concatenate([out, x[x < q - low][:missing] + low])
+        return out
+
+    def matrix_mod(self, rows, cols, q):
+        return self.vector_mod(rows * cols, q).reshape(rows, cols)
+
+    def permutation(self, n):
+        """
+        Uniform permutation of range(n) as numpy array, via Fisher-Yates.
+        """
+        perm = np.arange(n, dtype = np.int64)
+        for i in range(n - 1, 0, -1):
+            j = self.randint_mod(i + 1)
+            perm[i], perm[j] = perm[j], perm[i]
+        return perm
+
+    def fixed_weight(self, n, w):
+        """
+        Sorted numpy array of w distinct positions in range(n), uniform
+        among the subsets of size w. Every call reads 8n bytes and sorts
+        them: the positions are the indices of the w smallest random keys
+        (the index is stored in the low bits, so there are no ties).
+        """
+        if not 0 <= w <= n:
+            raise ValueError(f'Weight {w} not in range for {n} positions')
+        bits = bit_length(n)
+        keys = np.frombuffer(self.read(8 * n), dtype = '<u8') >> np.uint64(bits)
+        keys = (keys << np.uint64(bits)) | np.arange(n, dtype = np.uint64)
+        positions = np.sort(keys)[:w] & np.uint64((1 << bits) - 1)
+        return np.sort(positions).astype(np.int64)
+
+    def invertible_matrix(self, n, q):
+        """
+        Uniform invertible n x n matrix over GF(q), q prime.
+        """
+        M = self.matrix_mod(n, n, q)
+        while not is_invertible(M, q):
+            M = self.matrix_mod(n, n, q)
+        return M
+
+    def systematic_generator(self, k, n, q):
+        """
+        Generator matrix [I_k | V] with V uniform over GF(q), i.e. the
+        systematic form of a uniform code with information set range(k).
+        """
+        G = np.zeros((k, n), dtype = np.int64)
+        G[:, :k] = np.eye(k, dtype = np.int64)
+        G[:, k:] = self.matrix_mod(k, n - k, q)
+        return G
+
+
+class LevelHasher():
+    """
+    Batched SHAKE hashing of whole tree levels.
+
+    The salt is absorbed once and the resulting state is copied for every
+    node, so that hashing a level costs a single Python call. Levels are
+    contiguous buffers (or lists) of nodes of `width = ceil(lam/8)` bytes.
+    Different operations are domain separated with a one byte prefix.
+    """
+    LEAF, NODE, SEED = b'\x00', b'\x01', b'\x02'
+
+    def __init__(self, SALT = b'', lam = 128):
+        self.lam = lam
+        self.width = ceil(lam/8)
+        state = shake_128(to_bytes(SALT, lam = lam))
+        self._leaf = state.copy()
+        self._leaf.update(self.LEAF)
+        self._node = state.copy()
+        self._node.update(self.NODE)
+        self._seed = state.copy()
+        self._seed.update(self.SEED)
+
+    def _as_buffer(self, level):
+        if isinstance(level, (list, tuple)):
+            return b''.join(level)
+        return memoryview(level).cast('B')
+
+    def hash_leaves(self, data):
+        """
+        Hashes every element of `data`, returns the concatenated digests.
+        """
+        w = self.width
+        out = bytearray(w * len(data))
+        copy = self._leaf.copy
+        for i, d in enumerate(data):
+            h = copy()
+            h.update(to_bytes(d, lam = self.lam))
+            out[i*w:(i+1)*w] = h.digest(w)
+        return bytes(out)
+
+    def hash_level(self, level):
+        """
+        Hashes adjacent pairs of nodes, returns the parent level.
+        """
+        w = self.width
+        buff = self._as_buffer(level)
+        if len(buff) % (2*w):
+            raise ValueError(f'Level of {len(buff)} bytes is not made of pairs of {w} bytes nodes')
+        out = bytearray(len(buff) // 2)
+        copy = self._node.copy
+        for i in range(len(buff) // (2*w)):
+            h = copy()
+            h.update(buff[2*i*w:(2*i+2)*w])
+            out[i*w:(i+1)*w] = h.digest(w)
+        return bytes(out)
+
+    def expand_level(self, level):
+        """
+        Expands every seed in two children seeds, returns the next level.
+        """
+        w = self.width
+        buff = self._as_buffer(level)
+        out = bytearray(2 * len(buff))
+        copy = self._seed.copy
+        for i in range(len(buff) // w):
+            h = copy()
+            h.update(buff[i*w:(i+1)*w])
+            out[2*i*w:(2*i+2)*w] = h.digest(2*w)
+        return bytes(out)
+
+def split_nodes(buff, width):
+    return [bytes(buff[i:i+width]) for i in range(0, len(buff), width)]
+
+
+def tree_size(num_leaves):
+    """
+    Returns the number of leaves of the smallest complete binary tree with
+    at least `num_leaves` leaves and its depth.
+    """
+    size, deep = 1, 0
+    while size < num_leaves:
+        size *= 2
+        deep += 1
+    return size, deep
+
+def tail_cover_indices(x, deep, left = True):
+    """
+    Heap indices of the minimal set of nodes covering the first (or last)
+    x leaves of a tree of the given depth, from the biggest subtree to the
+    smallest one.
+    """
+    if x == 2**deep:
+        return [1]
+    elif x > 2**deep:
+        raise ValueError(f'Tail lenght {x} higher then data lenght {2**deep}')
+    cover = []
+    for depth in range(1, deep + 1):
+        prefix = x >> (deep - depth)
+        if prefix & 1:
+            cover.append(2**depth + prefix - 1 if left else 2**(depth + 1) - prefix)
+    return cover
+
+
 class MerkleTree:
-    def __init__(self, data):
+    """
+    Merkle tree stored in a single contiguous buffer in heap order:
+    node `i` (the root is node 1, the children of `i` are `2*i` and `2*i+1`)
+    occupies bytes `[(i-1)*width, i*width)`, leaves are nodes
+    `size, ..., 2*size - 1`. Missing leaves are padded with zero digests,
+    the input data is never modified.
+    """
+    def __init__(self, data, SALT = b'', lam = 128):
+        self.hasher = LevelHasher(SALT = SALT, lam = lam)
+        self.width = self.hasher.width
         self.intial_len = len(data)
-        length = len(data)
-        next_power_of_two = 1
-        self.deep = 0
-        while next_power_of_two < length:
-            next_power_of_two *= 2
-            self.deep += 1
-        if next_power_of_two > length:
-            padding = next_power_of_two - length
-            data.extend(['0'] * padding)
-        self.data = data
-        self.levels = []
+        self.size, self.deep = tree_size(len(data))
+        self.nodes = bytearray((2*self.size - 1) * self.width)
         self.construct_tree(data)
 
     def construct_tree(self, data):
+        w = self.width
         # Initialize the bottom level with hashes of individual data elements
-        current_level = [cmt(d) for d in data]
-        self.levels.append(current_level)
-
-        while len(current_level) > 1:
-            next_level = []
-            # Combine adjacent hashes to create parent hashes
-            for i in range(0, len(current_level), 2):
-                hash_pair = current_level[i] + current_level[i+1] if i+1 < len(current_level) else current_level[i]
-                next_level.append(cmt(hash_pair))
-            self.levels.append(next_level)
-            current_level = next_level
+        leaves = self.hasher.hash_leaves(data)
+        self.nodes[(self.size - 1)*w:(self.size - 1)*w + len(leaves)] = leaves
+
+        # Combine adjacent hashes to create parent hashes, a level per call
+        for depth in range(self.deep, 0, -1):
+            level = self.level(depth)
+            start = (2**(depth - 1) - 1) * w
+            self.nodes[start:start + len(level)//2] = self.hasher.hash_level(level)
+
+    def node(self, index):
+        """
+        Returns the digest of the node `index` in heap order.
+        """
+        return bytes(self.nodes[(index - 1)*self.width:index*self.width])
+
+    def level(self, depth):
+        """
+        Returns a view over the nodes at the given depth (the root has depth 0).
+        """
+        w = self.width
+        return memoryview(self.nodes)[(2**depth - 1)*w:(2**(depth + 1) - 1)*w]
 
     def get_root(self):
-        return self.levels[-1][0]
+        return self.node(1)
 
     def __repr__(self):
-        return f'Merkle tree with {self.deep} levels, for {self.intial_len} entries and root {self.get_root()}'
+        return f'Merkle tree with {self.deep} levels, for {self.intial_len} entries and root {to_hex(self.get_root())}'
 
     def print_tree(self):
         i = 0
         space = '    '
-        for level in self.levels:
+        for depth in range(self.deep, -1, -1):
             print(f'lvl {self.deep - i} :', end=' ')
-            for hash in level:
-                print(f'{space * (2**i - 1)}{hash[:4]}...{space * (2**i - 1)}', end=' ')
+            for hash in split_nodes(self.level(depth), self.width):
+                print(f'{space * (2**i - 1)}{to_hex(hash)[:4]}...{space * (2**i - 1)}', end=' ')
             print('')
             i += 1
 
+    def auth_path(self, index):
+        """
+        Authentication path of the index-th leaf: the sibling digests from
+        the leaf level up to the children of the root.
+        """
+        if not 0 <= index < self.intial_len:
+            raise ValueError(f'Leaf index {index} out of range')
+        path = []
+        i = self.size + index
+        while i > 1:
+            path.append(self.node(i ^ 1))
+            i >>= 1
+        return path
+
+    def multi_proof(self, indices):
+        """
+        Deduplicated proof for a set of leaves: the digests of the nodes
+        that can not be recomputed from the opened leaves, level by level
+        from the bottom and sorted by index within a level.
+        """
+        proof = []
+        known = sorted({self.size + i for i in indices})
+        if known and not (self.size <= known[0] and known[-1] < self.size + self.intial_len):
+            raise ValueError('Leaf index out of range')
+        while known and known[0] > 1:
+            parents = []
+            j = 0
+            while j < len(known):
+                i = known[j]
+                if i ^ 1 == (known[j + 1] if j + 1 < len(known) else None):
+                    j += 2
+                else:
+                    proof.append(self.node(i ^ 1))
+                    j += 1
+                parents.append(i >> 1)
+            known = parents
+        return proof
+
     def tail_cover(self, x, left = True):
-        # Returns the cover of the left tail of the tree using x consecutive entries
-        if x == len(self.data):
-            return self.get_root()
-        elif x > len(self.data):
-            raise ValueError(f'Tail lenght {x} higher then data lenght {self.data}')
-        bin = x.binary().rjust(self.deep,'0')
-        print(bin)
-        cover = []
-        j = 1
-        for (idx,c) in enumerate(bin):
-            internal_idx = ZZ('0b'+bin[:j])
-            level_hashes = self.levels[self.deep - idx - 1]
-            # print(f'{idx = }, {internal_idx = }, {c = }')
-            # print([h[:8] + '...' for h in level_hashes])
-            if c == '1':
-                if not left:
-                    level_hashes.reverse()
-                cover.append(level_hashes[internal_idx - 1])
-            j += 1
-
-        return cover
-
-def tail_cover_verify(cover, data, root, initial_len = None, left = True, ground_level = True):
-    if ground_level:
-        if left:
-            if initial_len:
-                length = len(data)
-                next_power_of_two = 1
-                while next_power_of_two < initial_len:
-                    next_power_of_two *= 2
-                if next_power_of_two > length:
-                    padding = next_power_of_two - initial_len
-                    data.extend(['0'] * padding)
-            data.reverse()
-        data = [cmt(d) for d in data]
-    elif not cover and len(data) == 1:
-        return root == data[0]
-
-    if len(data) % 2:
-        data.append(cover.pop())
-    # print([h[:4] + '...' for h in data])
-
-    if left:
-        new_data = [cmt(data[2*i+1] + data[2*i]) for i in range(len(data)//2)]
-    else:
-        new_data = [cmt(data[2*i] + data[2*i+1]) for i in range(len(data)//2)]
+        """
+        Returns the cover of the left (or right) tail of the tree made of x
+        consecutive entries.
+        """
+        return [self.node(i) for i in tail_cover_indices(x, self.deep, left = left)]
 
-    return tail_cover_verify(cover, new_data, root, left = left, ground_level = False)
+    def cover(self, opened):
+        """
+        Returns the digests of the minimal set of nodes covering all the
+        entries but the `opened` ones, in the order given by `seed_cover_indices`
+        (the same nodes revealed by a seed tree hiding these leaves).
+        """
+        return [self.node(i) for i in seed_cover_indices(opened, self.intial_len)]
+
+
+def merkle_fold(known, deep, hasher, proof = ()):
+    """
+    Iteratively recomputes the root from a dictionary {heap index: digest}.
+    Missing siblings are read, in order, from `proof`. Returns None if the
+    known nodes and the proof are not consistent with a tree of depth `deep`.
+    """
+    known = dict(known)
+    proof = iter(proof)
+    by_depth = [[] for _ in range(deep + 1)]
+    for i in known:
+        if not 1 <= i < 2**(deep + 1):
+            return None
+        by_depth[i.bit_length() - 1].append(i)
+    for depth in range(deep, 0, -1):
+        level = sorted(by_depth[depth])
+        pairs, parents = [], []
+        j = 0
+        while j < len(level):
+            i = level[j]
+            if j + 1 < len(level) and level[j + 1] == i ^ 1:
+                j += 2
+            else:
+                sibling = next(proof, None)
+                if sibling is None:
+                    return None
+                known[i ^ 1] = sibling
+                j += 1
+            pairs.append(known[i & ~1])
+            pairs.append(known[i | 1])
+            parents.append(i >> 1)
+        if not pairs:
+            continue
+        for (i, digest) in zip(parents, split_nodes(hasher.hash_level(pairs), hasher.width)):
+            if i in known:
+                if known[i] != digest:
+                    return None
+            else:
+                by_depth[depth - 1].append(i)
+                known[i] = digest
+    if next(proof, None) is not None:
+        return None
+    return known.get(1)
+
+def verify_multi_proof(root, leaves, proof, num_leaves, SALT = b'', lam = 128, hasher = None):
+    """
+    Checks a proof produced by `MerkleTree.multi_proof`.
+
+    Parameters:
+    - root (bytes): Root of the tree.
+    - leaves (dict): Opened leaves as {index: data}.
+    - proof (list): Digests returned by `multi_proof`.
+    - num_leaves (int): Number of entries of the tree.
+    """
+    if hasher is None:
+        hasher = LevelHasher(SALT = SALT, lam = lam)
+    size, deep = tree_size(num_leaves)
+    indices = list(leaves)
+    if not all(0 <= i < num_leaves for i in indices):
+        return False
+    digests = split_nodes(hasher.hash_leaves([leaves[i] for i in indices]), hasher.width)
+    known = {size + i: d for (i, d) in zip(indices, digests)}
+    return merkle_fold(known, deep, hasher, proof) == root
+
+def verify_path(root, leaf, index, path, num_leaves, SALT = b'', lam = 128):
+    """
+    Checks an authentication path produced by `MerkleTree.auth_path`.
+    """
+    return verify_multi_proof(root, {index: leaf}, path, num_leaves, SALT = SALT, lam = lam)
+
+def verify_batch(root, openings, num_leaves, SALT = b'', lam = 128):
+    """
+    Checks many (leaves, proof) openings against the same root,
+    returns the list of results.
+    """
+    hasher = LevelHasher(SALT = SALT, lam = lam)
+    return [verify_multi_proof(root, leaves, proof, num_leaves, hasher = hasher) for (leaves, proof) in openings]
+
+def tail_cover_root(cover, data, x, num_leaves, left = True, SALT = b'', lam = 128, hasher = None):
+    """
+    Recomputes the root of a Merkle tree from a cover of the left (or right)
+    tail of x entries given by `MerkleTree.tail_cover` and the data of the
+    remaining entries. The right tail is counted from the end of the padded
+    tree. Returns None if the cover or the data have the wrong length.
+    """
+    if hasher is None:
+        hasher = LevelHasher(SALT = SALT, lam = lam)
+    size, deep = tree_size(num_leaves)
+    cover_indices = tail_cover_indices(x, deep, left = left)
+    if len(cover) != len(cover_indices):
+        return None
+    known = dict(zip(cover_indices, cover))
+    first = x if left else 0
+    last = num_leaves if left else min(size - x, num_leaves)
+    if len(data) != max(last - first, 0):
+        return None
+    leaves = split_nodes(hasher.hash_leaves(data), hasher.width)
+    for (i, digest) in enumerate(leaves):
+        known[size + first + i] = digest
+    for i in range(max(first, num_leaves), size if left else size - x):
+        known[size + i] = bytes(hasher.width)
+    return merkle_fold(known, deep, hasher)
+
+def cover_root(leaves, cover, num_leaves, SALT = b'', lam = 128, hasher = None):
+    """
+    Recomputes the root of a Merkle tree from the opened entries, given as
+    {index: data}, and the cover of the other ones given by `MerkleTree.cover`.
+    Returns None if the cover has the wrong length.
+    """
+    if hasher is None:
+        hasher = LevelHasher(SALT = SALT, lam = lam)
+    size, deep = tree_size(num_leaves)
+    indices = seed_cover_indices(list(leaves), num_leaves)
+    if len(cover) != len(indices):
+        return None
+    known = {i: bytes(node) for (i, node) in zip(indices, cover)}
+    digests = split_nodes(hasher.hash_leaves(list(leaves.values())), hasher.width)
+    known.update((size + i, digest) for (i, digest) in zip(leaves, digests))
+    # the padding leaves not below a node of the cover are zero digests
+    for i in range(size + num_leaves, 2*size):
+        j = i >> 1
+        while j > 1 and j not in known:
+            j >>= 1
+        if j not in known:
+            known[i] = bytes(hasher.width)
+    return merkle_fold(known, deep, hasher)
+
+def tail_cover_verify(cover, data, root, x, num_leaves, left = True, SALT = b'', lam = 128):
+    """
+    Checks a cover of the left (or right) tail of x entries given by
+    `MerkleTree.tail_cover` together with the data of the remaining entries.
+    """
+    new_root = tail_cover_root(cover, data, x, num_leaves, left = left, SALT = SALT, lam = lam)
+    return new_root is not None and new_root == root
 
 
 class SeedTree():
+    """
+    Seed tree stored, as `MerkleTree`, in a single buffer in heap order.
+    Every seed is expanded in its two children with the salted `LevelHasher`.
+    """
     def __init__(self, num_leaves, SALT = None, SEED = None, lam = 128):
         self.num_leaves = num_leaves
         self.lam = lam
-        next_power_of_two = 1
-        self.deep = 0
-        while next_power_of_two < num_leaves:
-            next_power_of_two *= 2
-            self.deep += 1
-        if SEED:
-            self.root = to_hex(SEED)
-        else:
-            self.root = to_hex(randint(0,2**self.lam - 1))
-        if SALT:
-            self.salt = to_hex(SALT)
-        else:
-            self.salt = to_hex(randint(0,2**self.lam - 1))
-        self.levels = []
+        self.size, self.deep = tree_size(num_leaves)
+        # fresh root and salt from the OS randomness when not given
+        if SEED is None:
+            SEED = urandom(ceil(self.lam/8))
+        if SALT is None:
+            SALT = urandom(ceil(self.lam/8))
+        self.root = seed_to_bytes(SEED, lam = self.lam)
+        self.salt = seed_to_bytes(SALT, lam = self.lam)
+        self.hasher = LevelHasher(SALT = self.salt, lam = self.lam)
+        self.width = self.hasher.width
+        self.nodes = bytearray((2*self.size - 1) * self.width)
         self.construct_tree()
-        self.leaves = self.levels[-1][:num_leaves]
+        self.leaves = split_nodes(self.level(self.deep)[:num_leaves * self.width], self.width)
 
     def construct_tree(self):
-        # Initialize the bottom level with hashes of individual data elements
-        current_level = [self.root]
-        self.levels.append(current_level)
-        j = 0
-        while len(current_level) < self.num_leaves:
-            next_level = []
-            # Combine adjacent hashes to create parent hashes
-            for i in range(0, len(current_level)):
-                seed_0, seed_1 = expand_children(SEED = current_level[i], SALT = self.salt, lam = self.lam)
-                next_level.append(seed_0)
-                next_level.append(seed_1)
-
-            self.levels.append(next_level)
-            current_level = next_level
-            j += 1 
+        # Start from the root and expand a whole level per call
+        w = self.width
+        self.nodes[:w] = self.root
+        for depth in range(self.deep):
+            start = (2**(depth + 1) - 1) * w
+            self.nodes[start:start + 2**(depth + 1) * w] = self.hasher.expand_level(self.level(depth))
+
+    def node(self, index):
+        return bytes(self.nodes[(index - 1)*self.width:index*self.width])
+
+    def level(self, depth):
+        w = self.width
+        return memoryview(self.nodes)[(2**depth - 1)*w:(2**(depth + 1) - 1)*w]
 
     def get_root(self):
-        return self.levels[0][0]
+        return self.root
 
     def get_leaves(self):
         return self.leaves
 
     def __repr__(self):
-        return f'Seed tree with with {self.num_leaves} leaves and root {self.get_root()}'
+        return f'Seed tree with with {self.num_leaves} leaves and root {to_hex(self.get_root())}'
 
     def print_tree(self):
         # just fun Function 
         i = self.deep
         space = '    '
-        for level in self.levels:
+        for depth in range(self.deep + 1):
             print(f'lvl {self.deep - i} :', end=' ')
-            for hash in level:
-                print(f'{space * (2**i - 1)}{hash[:4]}...{space * (2**i - 1)}', end=' ')
+            for hash in split_nodes(self.level(depth), self.width):
+                print(f'{space * (2**i - 1)}{to_hex(hash)[:4]}...{space * (2**i - 1)}', end=' ')
             print('')
             i -= 1
-        pass
 
     def get_cover_single(self, index):
         """
         return a cover to get all the leaves but the index-th one
         """
-        pass
-
+        return self.get_cover([index])
 
-    def get_cover(self, subset):
-        # Initialize the cover with the given subset of leaves
-        cov = cover(subset)
-        cover_seeds = []
-        level = 0
-        for level_cover in cov:
-            level += 1
-            level_seeds = { (idx,seed) for (idx,seed) in enumerate(self.levels[-level]) if idx in level_cover}
-            cover_seeds.append(level_seeds)
-        return cover_seeds
+    def get_cover(self, hidden):
+        """
+        Returns the seeds of the minimal set of nodes that allows to
+        recompute all the leaves but the ones in `hidden`, in the order
+        given by `seed_cover_indices`.
+        """
+        return [self.node(i) for i in seed_cover_indices(hidden, self.num_leaves)]
 
 def expand_children(SEED, SALT, lam):
-        with seed(
-                to_int(SALT + SEED)
-                ):
-            seed_0 = randint(0,2**lam - 1)
-            seed_0 = to_hex(seed_0, lam=lam)
-            seed_1 = randint(0,2**lam - 1)
-            seed_1 = to_hex(seed_1, lam=lam)
-        return seed_0, seed_1
-
-def seeds_from_cover(subset,cover_seeds, SALT, dept):
-    cov = cover(subset)
-    for level in range(len(cov)):
-        for index in range(len(cov[level])):
-            pass
-
-
-
-
-def one_level_cover(subset):
-    buff = []
-    subset_copy = subset.copy()
-    for x in subset:
-        if x % 2 == 0 and (x+1) in subset:
-            buff.append(x // 2)
-            subset_copy.remove(x)
-            subset_copy.remove(x+1)
-    return subset_copy,buff
-
-
-def cover(subset):
-    subset_cleared, new_subset = one_level_cover(subset)
-    cov = [ subset_cleared ]
-    while new_subset:
-        subset_cleared, new_subset = one_level_cover(new_subset)
-        cov.append(subset_cleared)
-    return cov
+    w = ceil(lam/8)
+    children = LevelHasher(SALT = seed_to_bytes(SALT, lam = lam), lam = lam).expand_level(seed_to_bytes(SEED, lam = lam))
+    return children[:w], children[w:]
+
+def seed_cover_indices(hidden, num_leaves):
+    """
+    Heap indices (sorted) of the minimal set of nodes of a seed tree with
+    `num_leaves` leaves covering all the leaves not in `hidden`.
+    Padding leaves are neither hidden nor needed. Runs in O(num_leaves).
+    """
+    size, deep = tree_size(num_leaves)
+    is_hidden = bytearray(2*size)
+    is_needed = bytearray(2*size)
+    is_needed[size:size + num_leaves] = b'\x01' * num_leaves
+    for i in hidden:
+        if not 0 <= i < num_leaves:
+            raise ValueError(f'Leaf index {i} out of range')
+        is_hidden[size + i] = 1
+        is_needed[size + i] = 0
+    for i in range(size - 1, 0, -1):
+        is_hidden[i] = is_hidden[2*i] | is_hidden[2*i + 1]
+        is_needed[i] = is_needed[2*i] | is_needed[2*i + 1]
+    return [i for i in range(1, 2*size) if is_needed[i] and not is_hidden[i] and (i == 1 or is_hidden[i >> 1])]
+
+def seeds_from_cover(hidden, cover_seeds, SALT, num_leaves, lam = 128):
+    """
+    Recomputes the leaves of a seed tree from the cover returned by
+    `SeedTree.get_cover(hidden)`. Hidden leaves are returned as None.
+    """
+    size, deep = tree_size(num_leaves)
+    indices = seed_cover_indices(hidden, num_leaves)
+    if len(indices) != len(cover_seeds):
+        raise ValueError('Cover not consistent with the hidden leaves')
+    hasher = LevelHasher(SALT = seed_to_bytes(SALT, lam = lam), lam = lam)
+    w = hasher.width
+    # nodes to expand at each depth, as (heap indices, contiguous seeds)
+    by_depth = [([], []) for _ in range(deep + 1)]
+    for (i, s) in zip(indices, cover_seeds):
+        by_depth[i.bit_length() - 1][0].append(i)
+        by_depth[i.bit_length() - 1][1].append(seed_to_bytes(s, lam = lam))
+    for depth in range(deep):
+        nodes, seeds = by_depth[depth]
+        if not nodes:
+            continue
+        children = split_nodes(hasher.expand_level(seeds), w)
+        for (k, i) in enumerate(nodes):
+            by_depth[depth + 1][0].extend((2*i, 2*i + 1))
+            by_depth[depth + 1][1].extend(children[2*k:2*k + 2])
+    leaves = [None] * num_leaves
+    for (i, s) in zip(*by_depth[deep]):
+        if i - size < num_leaves:
+            leaves[i - size] = s
+    return leaves
 
 def N_seed(t,w,max = False):
+    """
+    Number of seeds revealed by a seed tree with t leaves and w hidden ones.
+    The bound w*log(t/w) is used both for the max and the average size.
+    """
     if t < w:
         raise ValueError(f'Invalid input for seed cost estimator {t =}, {w =}')
+    elif w == 0:
+        return 0
     else:
         return ceil(w * log(t / w, 2))
 
 def l_tail(t, max = False):
+    """
+    Number of nodes in the tail cover of a Merkle tree with t leaves:
+    log(t) in the worst case (max) and log(t)/2 on average.
+    """
     if not max:
         # we use the approximation since it is always a good bound
         return log(t,2)/2
@@ -1,9 +1,15 @@
 # SageMath imports
-from sage.all import randint, ZZ, factor, proof, binomial
+from sage.all import randint, ZZ, factor, proof
 from sage.categories.action import Action
 from action import CryptoAction
-from general_purpose import MerkleTree, SeedTree, cmt, N_seed, l_tail
-from math import ceil, log
+from general_purpose import MerkleTree, SeedTree, PRG, cmt, hash_message, seed_to_bytes, pack_ints, unpack_ints, bit_length, seed_cover_indices, seeds_from_cover, cover_root, tail_cover_indices, tree_size
+from parallel import RoundContext, RoundExecutor, round_salt, retries
+from collections import namedtuple
+from keystore import PublicKeyStore
+from math import ceil
+import numpy as np
+from os import urandom
+import parameters
 
 
 class GRASS():
@@ -16,6 +22,9 @@ class GRASS():
                  skip = False,
                  skip_left = True,
                  num_rounds = None,
+                 canonical = False,
+                 workers = None,
+                 chunksize = 16,
                  lam = 128):
         """
         Initializes a GRASS object.
@@ -26,8 +35,12 @@ class GRASS():
         - fixed_weight (bool): Whether to use fixed weight for the signature.
         - w (int): Weight parameter for fixed weight signature.
         - MPC (bool): Whether to use MPC-in-the-Head.
-        - N (int): Number of rounds.
+        - N (int): Number of parties for MPC-in-the-Head.
         - skip (bool): Whether to skip edges.
+        - canonical (bool): Whether to commit to canonical forms of the set elements
+          (the action must implement `canonical`, `canonical_response` and `canonical_act`).
+        - workers (int): Number of processes evaluating the rounds (None for sequential execution).
+        - chunksize (int): Number of rounds sent to a worker at a time.
         - lam (int): Security parameter.
 
         Raises:
@@ -62,22 +75,31 @@ class GRASS():
             raise ValueError('Right Skipped edges incompatible with Fixed Weight')
         self.skip_left = skip_left
 
+        self.canonical = canonical
+        if self.canonical and action and not hasattr(action, 'canonical'):
+            raise ValueError('The action does not implement canonical forms')
+        if self.canonical and self.MPC:
+            raise ValueError('Canonical forms can not be used with MPC-in-the-Head')
+
         self.lam = lam
         self.num_public_keys = num_public_keys
 
-        # optimal evaluation of the rounds for the security level
-        if not self.fixed_weight:
-            self.num_rounds = ceil(lam / log(self.num_public_keys*self.N + 1,2))
-            self.w = ceil(self.num_rounds * (self.num_public_keys*self.N) / (self.num_public_keys*self.N + 1))
-        else:
-            self.num_rounds = self.w + 1
-            while ( binomial(self.num_rounds,self.w)*(self.N*self.num_public_keys)**self.w < 2**self.lam ) and self.num_rounds < 100000:
-                self.num_rounds += 1
+        # optimal evaluation of the rounds for the security level (memoized)
+        self.num_rounds, self.w = parameters.rounds(lam, w = self.w, N = self.N, num_public_keys = self.num_public_keys, fixed_weight = self.fixed_weight)
+        if self.num_rounds is None:
+            raise ValueError(f'Weight {w} too small to reach {lam} bits of security in {parameters.MAX_ROUNDS} rounds')
+
+        # Execution of the rounds
+        self.workers = workers
+        self.chunksize = chunksize
+        self._executor = None
 
         # Variables for commitments
+        self.salt = None
+        self.commitment_tree = None
         self.commitment_secrets = None
         self.commit_hash = None
-        self.commitment_elements = None
+        self.commitment_digests = None
 
         # Variables for the challenge
         self.ch = None # lam bit string used as seed to generate the challenge
@@ -101,72 +123,126 @@ class GRASS():
 
 
 
-    def size(self, set_cost, group_cost, bytes = True, max = False):
+    def size(self, set_cost = None, group_cost = None, bytes = True, max = False):
         """
         Computes the size of various components.
 
         Parameters:
-        - set_cost (int): Cost of set operations.
-        - group_cost (int): Cost of group operations.
+        - set_cost (int): Cost of set operations (measured on the action if not given).
+        - group_cost (int): Cost of group operations (measured on the action if not given).
         - bytes (bool): Whether to return size in bytes.
         - max (bool): Whether to return max or average size of the signature.
 
         Returns:
         - dict: Size of public key, signature, group actions, and verification group actions.
         """
-        lam = self.lam
-        if bytes:
-            lam /= 8
-
-        # the case for MPCitH is handled by the fact that for N = 1 
-        # the formulas for the signature are equivalent (log(N,2)=0)
-        # since the advantage is clear we always use seed tree
-
-        if self.fixed_weight:
-            # rows 10 and 14
-            sig = self.w * (group_cost + ceil(log(self.N,2)) * lam) + N_seed(t = self.num_rounds, w = self.w, max = max)*lam + 3 * lam
-            # rows 19 and 20
-            if self.skip and self.skip_left:
-                sig += 2 * lam * N_seed(t = self.num_rounds, w = self.w, max = max)
-                sig += w * 2 * lam * l_tail(t = self.N - 1, max = max)
-        # no use of fixed weight
-        else:
-            # rows 2 and 12
-            if max:
-                sig = self.num_rounds * (group_cost + ceil(log(self.N,2))*lam) + 3 * lam
-            else:
-                sig = self.num_rounds * ceil(
-                    (1 - 1/(self.num_public_keys*self.N + 1)) * (group_cost + ceil(log(self.N,2))*lam) + 
-                    (1/(self.num_public_keys*self.N + 1)) * lam ) + 3*lam
-            # rows 17 and 18, we are using (41) and (42)
-            if self.skip and self.skip_left:
-                sig += self.num_rounds * 2 * lam * l_tail(t = self.N - 1, max = max)
-            elif self.skip and not self.skip_left:
-                raise ValueError("Right Skip signature sizes not implemented")
-
-        costs = {
-            'pub_key' : ceil(set_cost*self.num_public_keys + lam),
-            'signature' : ceil(sig),
-            'group_actions' : self.group_actions_verify,
-            'ver_group_actions' : self.group_actions_signing
-        }
-        return costs
-
-    def keygen(self):
+        if set_cost is None or group_cost is None:
+            if not self.A:
+                raise ValueError('Costs of set and group elements needed without an action')
+            # the action measures them in bytes
+            unit = 1 if bytes else 8
+            if set_cost is None:
+                set_cost = self.A.set_costs() * unit
+            if group_cost is None and self.canonical and not self.MPC:
+                # canonical responses are sent instead of the group elements
+                group_cost = (self.A.k * bit_length(self.A.n) + 7) // 8 * unit
+            elif group_cost is None:
+                group_cost = self.A.group_costs() * unit
+        if self.skip and not self.skip_left:
+            raise ValueError("Right Skip signature sizes not implemented")
+        # the cost model is shared with the vectorized parameters.size_grid
+        costs = parameters.size_grid(set_cost, group_cost, lam = self.lam, w = self.w or 0, N = self.N,
+                                     num_public_keys = self.num_public_keys, fixed_weight = self.fixed_weight,
+                                     skip = self.skip, bytes = bytes, max = max)
+        return {key : int(costs[key]) for key in ('pub_key', 'signature', 'group_actions', 'ver_group_actions')}
+
+    def keygen(self, path = None):
         """
         Returns the public key.
 
+        Parameters:
+        - path (str): If given, the public keys are written to this file as
+          soon as they are computed and the public key is a PublicKeyStore
+          mapping it (see `load_public_key`).
+
         Returns:
         - list: Public key.
         """
-        self.pk = []
         self.sk = []
-        for i in range(self.num_public_keys):
+        pk = self.key_pairs(self.sk)
+        if path is None:
+            self.pk = list(pk)
+        else:
+            self.pk = PublicKeyStore.write(self.A, path, pk)
+        self.close()
+        return self.pk
+
+    def key_pair(self):
+        """
+        Samples a secret key and the corresponding public key. As for the
+        round secrets in `commit`, secret keys sending the origin to an
+        element without systematic form are discarded.
+
+        Returns:
+        - tuple: (secret group element, public set element).
+        """
+        while True:
             key = self.A.rand_group()
-            self.sk.append(key)
-            self.pk.append(self.A.act(key,self.origin))
+            try:
+                return key, self.A.act(key,self.origin)
+            except ValueError:
+                continue
+
+    def key_pairs(self, sk):
+        """
+        Yields the num_public_keys public keys one at a time, appending the
+        corresponding secret keys to sk.
+        """
+        for _ in range(self.num_public_keys):
+            key, pk = self.key_pair()
+            sk.append(key)
+            yield pk
+
+    def load_public_key(self, path):
+        """
+        Uses the public key stored in path (by `keygen` or `PublicKeyStore.write`)
+        through a read-only memory mapping: the file is shared by all the
+        processes and each key is parsed only when a challenge refers to it.
+
+        Returns:
+        - PublicKeyStore: Public key.
+        """
+        pk = PublicKeyStore(self.A, path)
+        if len(pk) != self.num_public_keys:
+            pk.close()
+            raise ValueError(f'{path} contains {len(pk)} public keys instead of {self.num_public_keys}')
+        self.pk = pk
+        self.close()
         return self.pk
 
+    def executor(self):
+        """
+        Returns the executor evaluating the rounds for the current public key.
+        """
+        if self._executor is None:
+            self._executor = RoundExecutor(self.context(self.pk), workers = self.workers, chunksize = self.chunksize)
+        return self._executor
+
+    def context(self, pk):
+        """
+        Returns the RoundContext evaluating the rounds against the public key pk.
+        """
+        return RoundContext(self.A, self.origin, freeze(pk), self.canonical, self.lam, self.N if self.MPC else None,
+                            self.skip, self.skip_left, self.fixed_weight)
+
+    def close(self):
+        """
+        Stops the worker processes, if any.
+        """
+        if self._executor is not None:
+            self._executor.close()
+            self._executor = None
+
     def export_public_key(self):
         """
         Returns the public key.
@@ -178,60 +254,383 @@ class GRASS():
             raise ValueError(f"Must first generate a keypair with `self.keygen()`")
         return self.pk
 
-    def commitment(self):
+    def serialize_public_key(self, pk = None):
         """
-        Generates commitment.
+        Binary encoding of the public key (the one of `keygen` if not given):
+        the concatenation of the `to_bytes` serializations of its codes.
+        """
+        if pk is None:
+            pk = self.export_public_key()
+        if isinstance(pk, PublicKeyStore):
+            return pk.to_bytes()
+        return b''.join(x.to_bytes() for x in pk)
+
+    def deserialize_public_key(self, data):
+        """
+        Inverse of `serialize_public_key`, the codes are parsed (and
+        memoized) with `public_key_from_bytes` from views over data.
+        """
+        data = memoryview(data).cast('B')
+        size = self.A.set_costs()
+        if len(data) != size * self.num_public_keys:
+            raise ValueError(f'{len(data)} bytes do not encode {self.num_public_keys} public keys')
+        return [self.A.public_key_from_bytes(data[i*size:(i+1)*size]) for i in range(self.num_public_keys)]
+
+    def _tail_length(self, c):
+        # number of nodes of the tail cover revealed with skipped edges (with
+        # fixed weight the roots of the zero rounds are in the cover of their tree)
+        if not self.skip or (self.fixed_weight and c == 0):
+            return 0
+        return len(tail_cover_indices(self.context(()).tail(c), tree_size(self.N)[1], left = self.skip_left))
+
+    def _cover_length(self, c):
+        # number of seeds revealed for the non-zero challenge c with MPC-in-the-Head,
+        # without skipped edges the covers are padded to a fixed length
+        if not self.skip:
+            return parameters.max_cover(self.N, 1)
+        return len(seed_cover_indices(self.context(()).hidden(c), self.N))
+
+    def _retries_length(self):
+        # bytes of the numbers of replacements of the secrets of the zero rounds,
+        # only sent with fixed weight and skipped edges
+        if not (self.fixed_weight and self.skip):
+            return 0
+        return ceil(parameters.RETRY_BITS * (self.num_rounds - self.w) / 8)
+
+    def _padded(self, nodes, count):
+        # nodes followed by zero nodes up to count
+        w = ceil(self.lam/8)
+        if len(nodes) > count:
+            raise ValueError(f'Cover of {len(nodes)} seeds longer than {count}')
+        return [seed_to_bytes(x, lam = self.lam) for x in nodes] + [bytes(w)] * (count - len(nodes))
+
+    def _unpadded(self, nodes, count):
+        # first count nodes, the others must be padding
+        if any(any(x) for x in nodes[count:]):
+            raise ValueError('Non-zero padding in a cover')
+        return nodes[:count]
+
+    def response_size(self, c):
+        """
+        Number of bytes of the encoded response to the challenge c of a round
+        (with fixed weight, the seeds of the zero rounds are in the cover
+        counted by `signature_size`).
+        """
+        w = ceil(self.lam/8)
+        tail = self._tail_length(c) * w
+        if c == 0:
+            return (0 if self.fixed_weight else w) + tail
+        if self.MPC:
+            return self._cover_length(c) * w + self.A.group_costs() + tail
+        if self.canonical:
+            return (self.A.k * bit_length(self.A.n) + 7) // 8
+        return self.A.group_costs()
+
+    def signature_size(self, CH):
+        """
+        Exact number of bytes of the encoding of a signature with challenge
+        digest CH (the layout of the responses only depends on the challenge):
+        the salt, the digest, with fixed weight the padded cover of the seeds of
+        the zero rounds (and with skipped edges the one of their roots and
+        their numbers of replacements), and the responses.
+        """
+        size = ceil(self.lam/8) + ceil(self.lam/4)
+        if self.fixed_weight:
+            covers = 2 if self.skip else 1
+            size += covers * parameters.max_cover(self.num_rounds, self.w) * ceil(self.lam/8) + self._retries_length()
+        return size + sum(self.response_size(c) for c in self.challenges_from_digest(CH))
+
+    def serialize(self, sig):
+        """
+        Binary encoding of a signature (CH, SALT, RESP): the salt, the challenge
+        digest, with fixed weight the cover of the seeds of the zero rounds
+        (padded to the worst case, see `parameters.max_cover`) and with
+        skipped edges the cover of their roots (padded in the same way) and
+        their numbers of replacements (RETRY_BITS bits each), and the
+        responses of the rounds, without any length prefix.
+        Seeds and tree nodes take lam bits, group elements are packed by
+        their `to_bytes` (permutations on ceil(log2(n)) bits and scalars or
+        matrix entries on ceil(log2(q)) bits per entry).
+        """
+        CH, SALT, RESP = sig
+        challenges = self.challenges_from_digest(CH)
+        buff = [self.check_salt(SALT), bytes(CH)]
+        if self.fixed_weight:
+            if self.skip:
+                cover, roots, RESP = RESP
+            else:
+                cover, RESP = RESP
+            buff.extend(self._padded(cover, parameters.max_cover(self.num_rounds, self.w)))
+            if self.skip:
+                buff.extend(self._padded(roots, parameters.max_cover(self.num_rounds, self.w)))
+                counts = [r for (r, c) in zip(RESP, challenges) if c == 0]
+                if not all(0 <= k < 2**parameters.RETRY_BITS for k in counts):
+                    raise ValueError('signature not consistent with the parameters of the scheme')
+                buff.append(pack_ints(counts, parameters.RETRY_BITS))
+        for (r, c) in zip(RESP, challenges):
+            tail = ()
+            if c == 0:
+                if not self.fixed_weight:
+                    if self.skip:
+                        r, tail = r
+                    buff.append(seed_to_bytes(r, lam = self.lam))
+            elif self.MPC:
+                if self.skip:
+                    cover, h, tail = r
+                else:
+                    cover, h = r
+                buff.extend(self._padded(cover, self._cover_length(c)))
+                buff.append(h.to_bytes())
+            elif self.canonical:
+                buff.append(pack_ints(r, bit_length(self.A.n)))
+            else:
+                buff.append(r.to_bytes())
+            if self.skip:
+                buff.extend(bytes(node) for node in tail)
+        data = b''.join(buff)
+        if len(data) != self.signature_size(CH):
+            raise ValueError('signature not consistent with the parameters of the scheme')
+        return data
+
+    def deserialize(self, data):
+        """
+        Inverse of `serialize`. Seeds, tree nodes and group elements are
+        decoded from views over data, which is never copied.
 
         Returns:
-        - int: Commitment hash.
+        - tuple: Signature tuple (CH, SALT, RESP), as returned by `sign`.
         """
+        data = memoryview(data).cast('B')
+        w = ceil(self.lam/8)
+        SALT, CH = bytes(data[:w]), bytes(data[w:w + ceil(self.lam/4)])
+        challenges = self.challenges_from_digest(CH)
+        if len(data) != self.signature_size(CH):
+            raise ValueError(f'{len(data)} bytes do not encode a signature')
+        pos = w + ceil(self.lam/4)
+
+        def take(length):
+            nonlocal pos
+            pos += length
+            return data[pos - length:pos]
+
+        def nodes(count):
+            return [take(w) for _ in range(count)]
 
-        self.commitment_secrets = [randint(0,2**self.lam - 1) for _ in range(self.num_rounds)]
-        if not self.num_public_keysPC:
-            self.commitment_elements = [self.A.act(SEED,self.origin) for SEED in self.commitment_secrets]
-            self.commit_hash = cmt([cmt(x) for x in self.commitment_elements],lam = self.lam)
+        if self.fixed_weight:
+            seeds = nodes(parameters.max_cover(self.num_rounds, self.w))
+            length = len(seed_cover_indices(challenges.positions.tolist(), self.num_rounds))
+            seeds = self._unpadded(seeds, length)
+            if self.skip:
+                roots = self._unpadded(nodes(parameters.max_cover(self.num_rounds, self.w)), length)
+                counts = iter(unpack_ints(take(self._retries_length()), parameters.RETRY_BITS, self.num_rounds - self.w).tolist())
+        RESP = []
+        for c in challenges:
+            tail = self._tail_length(c)
+            if c == 0:
+                if self.fixed_weight:
+                    RESP.append(next(counts) if self.skip else None)
+                else:
+                    r = take(w)
+                    RESP.append((r, nodes(tail)) if self.skip else r)
+            elif self.MPC:
+                cover = nodes(self._cover_length(c))
+                if not self.skip:
+                    cover = self._unpadded(cover, len(seed_cover_indices(self.context(()).hidden(c), self.N)))
+                h = self.A.group_from_bytes(take(self.A.group_costs()))
+                RESP.append((cover, h, nodes(tail)) if self.skip else (cover, h))
+            elif self.canonical:
+                RESP.append(unpack_ints(take(self.response_size(c)), bit_length(self.A.n), self.A.k))
+            else:
+                RESP.append(self.A.group_from_bytes(take(self.A.group_costs())))
+        if self.fixed_weight:
+            RESP = (seeds, roots, RESP) if self.skip else (seeds, RESP)
+        return CH, SALT, RESP
+
+    def fresh_salt(self):
+        """
+        Returns a fresh salt of lam bits for a signature, from the OS randomness.
+        """
+        return urandom(ceil(self.lam/8))
+
+    def check_salt(self, SALT):
+        """
+        Returns the salt as bytes, raises ValueError if it is not made of ceil(lam/8) bytes.
+        """
+        if not isinstance(SALT, (bytes, bytearray, memoryview)) or len(SALT) != ceil(self.lam/8):
+            raise ValueError('Salt must be made of ceil(lam/8) bytes')
+        return bytes(SALT)
+
+    def commitment_hash(self, SALT, digests):
+        """
+        Commitment to the digests of the rounds of a signature with the given salt.
+        """
+        return cmt([SALT, digests], lam = self.lam)
+
+    def challenge_digest(self, SALT, COM, msg):
+        """
+        Challenge digest (of 2 lam bits) of the message msg for the salt and
+        the commitment COM.
+        """
+        return hash_message([SALT, COM], msg, lam = 2*self.lam)
+
+    def commit(self, executor):
+        """
+        Stateless commitment: samples a fresh salt and a seed tree whose leaves
+        are the round secrets, and evaluates them with the given executor.
+        With skipped edges the digests are the Merkle trees of the chains
+        (the round digest is their root), which `respond` needs for the tail
+        covers. With fixed weight and skipped edges, the commitment hash is
+        computed on the root of the Merkle tree of these roots followed by
+        the digests of the last elements of the chains: the verifier of a
+        zero round only recomputes the last one.
+
+        Returns:
+        - Commitment: Salt, seed tree, round secrets, digests and commitment hash.
+        """
+        SALT = self.fresh_salt()
+        rounds = [(None, None)]
+        # secrets without a valid element are replaced with `next_seed` by
+        # commit_round, the whole tree is resampled only if that fails
+        while any(d is None for (_, d) in rounds):
+            tree = SeedTree(self.num_rounds, SALT = SALT, lam = self.lam)
+            rounds = executor.map([(seed, i, SALT) for (i, seed) in enumerate(tree.leaves)], method = 'commit_round')
+        secrets = [x for (x, _) in rounds]
+        if self.skip:
+            digests = [MerkleTree(d, SALT = round_salt(SALT, i), lam = self.lam) for (i, (_, d)) in enumerate(rounds)]
+            roots = [d.get_root() for d in digests]
+            if self.fixed_weight:
+                roots = [MerkleTree(roots, SALT = SALT, lam = self.lam).get_root()] + [d[-1] for (_, d) in rounds]
         else:
-            raise ValueError('MPC-in-the-Head not implemented')
-            # generation of element via SeedTree()
-            # sequential appliation to the origin
-            self.commit_hash = cmt([MerkleTree(data) for data in self.commitment_elements],lam = self.lam)
+            digests = roots = [d for (_, d) in rounds]
+        return Commitment(SALT, tree, secrets, digests, self.commitment_hash(SALT, roots))
+
+    def commitment(self):
+        """
+        Generates commitment.
+
+        Returns:
+        - bytes: Commitment hash.
+        """
+        com = self.commit(self.executor())
+        self.salt, self.commitment_tree, self.commitment_secrets, self.commitment_digests, self.commit_hash = com
         return self.commit_hash
 
 
-    def challenge(self):
+    def challenge(self, prg = None):
         """
         Generates a list of random challenges for each
         round of the protocol.
 
+        Parameters:
+        - prg (PRG): Source of randomness, fresh if not given.
+
         Returns:
-        - list: Challenge.
+        - list: Challenge (a FixedWeightChallenge with fixed weight).
         """
+        if prg is None:
+            prg = PRG(lam = self.lam)
         if self.fixed_weight:
-            if self.num_public_keysPC:
-                raise ValueError('Challenge for MPC not yet implemented')
-            else:
-                buff = [0] * (self.num_rounds - self.w) + [randint(1,self.num_public_keys) for _ in range(self.w)]
-            shuffle(buff)
-            return buff
-        elif self.num_public_keysPC:
-            raise ValueError('Challenge for MPC not yet implemented')
+            positions = prg.fixed_weight(self.num_rounds, self.w)
+            keys = prg.vector_mod(self.w, self.num_public_keys*self.N)
+            return FixedWeightChallenge(self.num_rounds, positions, keys, self.N if self.MPC else None)
+        elif self.MPC:
+            # uniform over {0} and the num_public_keys*N pairs (key, party)
+            buff = [prg.randint(0,self.num_public_keys*self.N) for _ in range(self.num_rounds)]
+            return [0 if c == 0 else challenge_value(c - 1, self.N) for c in buff]
         else:
-            return [randint(0,self.num_public_keys) for _ in range(self.num_rounds)]
+            return [prg.randint(0,self.num_public_keys) for _ in range(self.num_rounds)]
+
+    def challenges_from_digest(self, ch):
+        """
+        Expands the challenge digest in the list of challenges.
+
+        Raises:
+        - ValueError: If ch is not a digest of ceil(lam/4) bytes.
+        """
+        if not isinstance(ch, (bytes, bytearray, memoryview)) or len(ch) != ceil(self.lam/4):
+            raise ValueError('Challenge digest must be made of ceil(lam/4) bytes')
+        return self.challenge(PRG(bytes(ch), lam = self.lam))
 
     def challenge_from_message(self, msg, ch = None):
         """
         Compute a challenge deterministically from a
         message
 
+        Parameters:
+        - msg: Message, as bytes, str, file object, memory-mapped file
+          or iterator of byte chunks (see `hash_message`).
+        - ch: Challenge digest, if already known.
+
         Returns:
         - list: Challenge.
         """
         if ch:
             self.ch = ch
         else:
-            self.ch = cmt([self.commit_hash,msg])
-        with seed(ZZ('0x' + self.ch)): CH = self.challenge()
-        return CH
+            self.ch = self.challenge_digest(self.salt, self.commit_hash, msg)
+        return self.challenges_from_digest(self.ch)
+
+    def respond(self, sk, com, ch):
+        """
+        Stateless response to the challenge ch for the given secret key and
+        Commitment returned by `commit`.
+
+        Returns:
+        - list: Response, with fixed weight the pair (cover, responses) where
+          the cover of the seed tree gives the secrets of the zero rounds
+          (their entries in the responses are None). With skipped edges the
+          triple (cover, roots, responses) where roots is the cover of the
+          tree of the roots of the chains opening the zero rounds, whose
+          entries are the numbers of replacements of their leaves (see
+          `RoundContext.max_retries`).
+        """
+        SALT, digests = com.salt, com.digests
+        resp = []
+        for idx, (x, c) in enumerate(zip(com.secrets, ch)):
+            if c == 0:
+                if self.fixed_weight:
+                    resp.append(retries(com.tree.leaves[idx], x, lam = self.lam) if self.skip else None)
+                elif self.skip:
+                    # the verifier recomputes a single element of the chain
+                    resp.append((x, self.tail_cover(digests[idx], c)))
+                else:
+                    resp.append(x)
+            elif self.MPC:
+                # all the seeds of the parties but the j-th one (only the ones
+                # after it or before it with skipped edges) and the element
+                # sending the c-th public key to x_j = g_1 * ... * g_j
+                key, j = c
+                tree = SeedTree(self.N, SALT = round_salt(SALT, idx), SEED = x, lam = self.lam)
+                g = self.A.rand_group(SEED = tree.leaves[0])
+                for seed in tree.leaves[1:j]:
+                    g = g * self.A.rand_group(SEED = seed)
+                h = sk[key - 1].inverse() * g
+                cover = tree.get_cover(self.context(()).hidden(c))
+                if not self.skip:
+                    resp.append((cover, h))
+                else:
+                    resp.append((cover, h, self.tail_cover(digests[idx], c)))
+            else:
+                gtilde = self.A.rand_group(SEED = x)
+                r = sk[c - 1].inverse() * gtilde
+                if self.canonical:
+                    # the information set is enough to recompute the canonical form
+                    r = self.A.canonical_response(r)
+                resp.append(r)
+        if self.fixed_weight and self.skip:
+            positions = ch.positions.tolist()
+            roots = MerkleTree([d.get_root() for d in digests], SALT = SALT, lam = self.lam)
+            return com.tree.get_cover(positions), roots.cover(positions), resp
+        if self.fixed_weight:
+            return com.tree.get_cover(ch.positions.tolist()), resp
+        return resp
+
+    def tail_cover(self, tree, c):
+        """
+        Cover of the edges skipped by the verifier for the challenge c in the
+        Merkle tree of the chain of a round.
+        """
+        return tree.tail_cover(self.context(()).tail(c), left = self.skip_left)
 
     def response(self,ch):
         """
@@ -251,23 +650,33 @@ class GRASS():
                 f"Must first generate a commitment with `self.commitment()`"
             )
 
-        for idx, x in enumerate(self.commitment_secrets):
-            if ch[idx] == 0:
-                self.resp.append(x)
-            else:
-                gtilde = self.A.rand_group(SEED = x)
-                self.resp.append(self.sk[ch[idx] - 1].inverse() * gtilde)
+        com = Commitment(self.salt, self.commitment_tree, self.commitment_secrets, self.commitment_digests, self.commit_hash)
+        self.resp = self.respond(self.sk, com, ch)
         return self.resp
 
+    def sign_with(self, sk, executor, msg):
+        """
+        Stateless signature of msg: all the intermediate values are locals.
+
+        Returns:
+        - tuple: Signature tuple (CH, SALT, RESP).
+        """
+        com = self.commit(executor)
+        CH = self.challenge_digest(com.salt, com.hash, msg)
+        RESP = self.respond(sk, com, self.challenges_from_digest(CH))
+        return CH, com.salt, RESP
+
     def sign(self, msg):
         """
         Signs a message.
 
         Parameters:
-        - msg: Message to be signed.
+        - msg: Message to be signed, as bytes, str, file object, memory-mapped
+          file or iterator of byte chunks; it is hashed in constant memory.
 
         Returns:
-        - tuple: Signature tuple (CH, RESP), where CH is the commitment hash and RESP is the response.
+        - tuple: Signature tuple (CH, SALT, RESP), where CH is the challenge digest,
+          SALT the fresh salt of the signature and RESP is the response.
         """
         # Make a commitment 
         COM = self.commitment()
@@ -278,28 +687,86 @@ class GRASS():
         # Compute a response for the challenge
         RESP = self.response(CH)
 
-        return Integer(self.ch), RESP
+        return self.ch, self.salt, RESP
 
-    def commit_recover(self, CH, RESP):
+    def round_tasks(self, CH, SALT, RESP):
+        """
+        Rounds (response, challenge, index, salt) to be evaluated by the
+        executor to verify a signature, raises ValueError (or TypeError)
+        if the signature is malformed.
+        """
+        challenges = self.challenges_from_digest(CH)
+        SALT = self.check_salt(SALT)
+        if self.fixed_weight:
+            cover, RESP = (RESP[0], RESP[2]) if self.skip else RESP
+            leaves = seeds_from_cover(challenges.positions.tolist(), cover, SALT, self.num_rounds, lam = self.lam)
+        if len(RESP) != len(challenges):
+            raise ValueError(f'Got {len(RESP)} responses for {len(challenges)} rounds')
+        tasks = []
+        for (idx, (r, c)) in enumerate(zip(RESP, challenges)):
+            if self.fixed_weight and c == 0:
+                r = (leaves[idx], r) if self.skip else leaves[idx]
+            tasks.append((r, c, idx, SALT))
+        return tasks
+
+    def recover_with(self, executor, CH, SALT, RESP):
+        """
+        Stateless version of `commit_recover`.
+        """
+        try:
+            tasks = self.round_tasks(CH, SALT, RESP)
+        except (TypeError, ValueError):
+            return None
+        new_commitment_digests = executor.map(tasks)
+        if None in new_commitment_digests:
+            return None
+        return self.recovered_hash(CH, SALT, RESP, new_commitment_digests)
+
+    def recovered_hash(self, CH, SALT, RESP, digests):
+        """
+        Commitment hash from the round digests recomputed by the verifier:
+        with fixed weight and skipped edges the root of the tree of the roots
+        is recomputed from the ones of the non-zero rounds and the cover of
+        the others in RESP (None if it is not valid).
+        """
+        SALT = bytes(SALT)
+        if not (self.fixed_weight and self.skip):
+            return self.commitment_hash(SALT, digests)
+        positions = self.challenges_from_digest(CH).positions.tolist()
+        try:
+            root = cover_root({i: digests[i][1] for i in positions}, RESP[1], self.num_rounds, SALT = SALT, lam = self.lam)
+        except (TypeError, ValueError):
+            return None
+        if root is None:
+            return None
+        return self.commitment_hash(SALT, [root] + [d for (d, _) in digests])
+
+    def commit_recover(self, CH, SALT, RESP):
         """
         Recovers commitment.
 
         Parameters:
         - CH: Commitment hash.
+        - SALT: Salt of the signature.
         - RESP: Response.
 
         Returns:
-        - int: New commitment hash.
+        - bytes: New commitment hash, None if the response is not valid.
         """
-        new_commitment_elements = []
-        with seed(ZZ('0x' + CH)): challenges = self.challenge()
-        for idx, c in enumerate(challenges):
-            if c == 0:
-                new_commitment_elements.append(cmt(self.A.act(RESP[idx],self.origin)))
-            else:
-                new_commitment_elements.append(cmt(self.A.act(RESP[idx],self.pk[c - 1])))
-        COM = cmt(new_commitment_elements)
-        return COM
+        return self.recover_with(self.executor(), CH, SALT, RESP)
+
+    def verify_with(self, executor, sig, msg):
+        """
+        Stateless version of `verify`.
+        """
+        try:
+            CH, SALT, RESP = sig
+        except (TypeError, ValueError):
+            return False
+        COM = self.recover_with(executor, CH, SALT, RESP)
+        if COM is None:
+            return False
+        return self.challenge_digest(bytes(SALT), COM, msg) == CH
 
     def verify(self, sig , msg):
         """
@@ -307,11 +774,195 @@ class GRASS():
 
         Parameters:
         - sig: Signature.
-        - msg: Message.
+        - msg: Message (same formats accepted by `sign`).
 
         Returns:
         - bool: True if signature is valid, False otherwise.
         """
-        CH, RESP = sig
-        COM = self.commit_recover(CH, RESP)
-        return cmt([COM,msg]) == CH
+        return self.verify_with(self.executor(), sig, msg)
+
+    def verify_batch_with(self, executor, sigs, msgs):
+        """
+        Stateless version of `verify_batch`.
+        """
+        if len(sigs) != len(msgs):
+            raise ValueError(f'Got {len(sigs)} signatures for {len(msgs)} messages')
+        results = [False] * len(sigs)
+        rounds = {}
+        for idx, sig in enumerate(sigs):
+            try:
+                CH, SALT, RESP = sig
+                rounds[idx] = self.round_tasks(CH, SALT, RESP)
+            except (TypeError, ValueError):
+                continue
+
+        # the i-th rounds of all the signatures come before the (i+1)-th ones,
+        # the rounds of a signature are dropped once one of them is not valid
+        queue = [(idx, tasks[i]) for i in range(self.num_rounds) for (idx, tasks) in rounds.items()]
+        digests = {idx : [] for idx in rounds}
+        wave = executor.wave()
+        for start in range(0, len(queue), wave):
+            batch = [(idx, task) for (idx, task) in queue[start:start + wave] if idx in digests]
+            for ((idx, _), d) in zip(batch, executor.map([task for (_, task) in batch])):
+                if d is None:
+                    digests.pop(idx, None)
+                elif idx in digests:
+                    digests[idx].append(d)
+
+        for (idx, new_commitment_digests) in digests.items():
+            CH, SALT, RESP = sigs[idx]
+            COM = self.recovered_hash(CH, SALT, RESP, new_commitment_digests)
+            if COM is None:
+                continue
+            results[idx] = self.challenge_digest(bytes(SALT), COM, msgs[idx]) == CH
+        return results
+
+    def verify_batch(self, sigs, msgs):
+        """
+        Verifies many signatures against the public key at once: the
+        rounds of all the signatures are evaluated as a single queue by the
+        executor, sharing the origin and the public key. Malformed
+        signatures are rejected before evaluating any group action, and
+        the rounds of a signature are no longer scheduled once one of them
+        is not valid (the queue is evaluated in waves of `RoundExecutor.wave`
+        rounds, taking the rounds of all the signatures in turn).
+
+        Parameters:
+        - sigs (list): Signatures.
+        - msgs (list): Messages, in the same order.
+
+        Returns:
+        - list: For every signature True if it is valid, False otherwise.
+        """
+        return self.verify_batch_with(self.executor(), sigs, msgs)
+
+    def generate_keys(self):
+        """
+        Generates a fresh key pair without storing it in the scheme.
+
+        Returns:
+        - SigningKey: Secret key, its public key is `verifying_key`.
+        """
+        sk = []
+        pk = list(self.key_pairs(sk))
+        return SigningKey(self, sk, VerifyingKey(self, pk))
+
+    def signing_key(self):
+        """
+        Returns the key pair generated with `keygen` as a SigningKey.
+        """
+        if not self.sk:
+            raise ValueError(f"Must first generate a keypair with `self.keygen()`")
+        return SigningKey(self, self.sk, VerifyingKey(self, self.pk))
+
+
+class Commitment(namedtuple('Commitment', ['salt', 'tree', 'secrets', 'digests', 'hash'])):
+    """
+    Commitment of a signature: the fresh salt, the seed tree whose leaves
+    give the round secrets, the round secrets (after the replacements of
+    `RoundContext.commit_round`), the round digests and the commitment hash.
+    """
+    __slots__ = ()
+
+
+def freeze(pk):
+    """
+    Immutable version of the public key, a PublicKeyStore is already read-only
+    and is kept as is so that its keys are parsed lazily.
+    """
+    if isinstance(pk, PublicKeyStore):
+        return pk
+    return tuple(pk)
+
+
+def challenge_value(k, N = None):
+    """
+    Non-zero challenge with flat index k in range(num_public_keys*N): the
+    public key index k // N + 1, with MPC-in-the-Head paired with the party
+    index k % N + 1 (N is None without MPC-in-the-Head).
+    """
+    if N is None:
+        return k + 1
+    return (k // N + 1, k % N + 1)
+
+
+class FixedWeightChallenge():
+    """
+    Compact fixed weight challenge: the sorted positions of the w non-zero
+    rounds and their flat key indices (see `challenge_value`). Iterating
+    over it gives the challenge of every round, as the lists returned by
+    `GRASS.challenge` in the other settings.
+    """
+    __slots__ = ('num_rounds', 'positions', 'keys', 'N')
+
+    def __init__(self, num_rounds, positions, keys, N = None):
+        self.num_rounds = num_rounds
+        self.positions = positions
+        self.keys = keys
+        self.N = N
+
+    def __len__(self):
+        return self.num_rounds
+
+    def nonzero(self):
+        """
+        Iterates over the pairs (round, challenge) of the non-zero rounds.
+        """
+        for (idx, k) in zip(self.positions.tolist(), self.keys.tolist()):
+            yield idx, challenge_value(k, self.N)
+
+    def __iter__(self):
+        last = 0
+        for (idx, c) in self.nonzero():
+            yield from [0] * (idx - last)
+            yield c
+            last = idx + 1
+        yield from [0] * (self.num_rounds - last)
+
+    def __getitem__(self, idx):
+        i = int(np.searchsorted(self.positions, idx))
+        if i < len(self.positions) and self.positions[i] == idx:
+            return challenge_value(int(self.keys[i]), self.N)
+        if not 0 <= idx < self.num_rounds:
+            raise IndexError(f'Round {idx} out of range')
+        return 0
+
+    def __repr__(self):
+        return f'Fixed weight challenge with {len(self.positions)} non-zero rounds out of {self.num_rounds}'
+
+
+class VerifyingKey():
+    """
+    Immutable public key of a GRASS scheme. Verification keeps all its
+    state in locals, so the same object can be shared by many threads
+    (or asyncio executors); the scheme must not be modified afterwards.
+    """
+    __slots__ = ('scheme', 'pk', 'executor')
+
+    def __init__(self, scheme, pk):
+        self.scheme = scheme
+        self.pk = freeze(pk)
+        self.executor = RoundExecutor(scheme.context(self.pk), workers = scheme.workers, chunksize = scheme.chunksize)
+
+    def verify(self, sig, msg):
+        return self.scheme.verify_with(self.executor, sig, msg)
+
+    def verify_batch(self, sigs, msgs):
+        return self.scheme.verify_batch_with(self.executor, sigs, msgs)
+
+
+class SigningKey():
+    """
+    Immutable secret key of a GRASS scheme, together with its
+    VerifyingKey. Signing keeps all its state in locals, so the same
+    object can be shared by many threads.
+    """
+    __slots__ = ('scheme', 'sk', 'verifying_key')
+
+    def __init__(self, scheme, sk, verifying_key):
+        self.scheme = scheme
+        self.sk = tuple(sk)
+        self.verifying_key = verifying_key
+
+    def sign(self, msg):
+        return self.scheme.sign_with(self.sk, self.verifying_key.executor, msg)
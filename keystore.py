@@ -0,0 +1,107 @@
+# Python imports
+from hashlib import sha256
+import mmap
+import os
+
+
+class PublicKeyStore():
+    """
+    Read-only public key backed by a memory-mapped file of packed set
+    elements (the `to_bytes` serialization of the systematic forms).
+
+    The file starts with a header made of the magic string, the number of
+    keys and the size of a key (4 bytes little endian each) and the SHA-256
+    of the parameters of the action (`CryptoAction.cache_key`), then the
+    keys follow one after the other. The mapping is shared by all the
+    processes through the page cache: a key is parsed (with
+    `action.set_from_bytes`) only the first time it is used in a process.
+    When pickled, e.g. in the RoundContext sent to the worker processes,
+    only the action and the path are sent and the file is mapped again.
+    """
+    MAGIC = b'GRASSPK\x00'
+    HEADER = len(MAGIC) + 8 + 32
+
+    def __init__(self, action, path):
+        self.action = action
+        self.path = path
+        with open(path, 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access = mmap.ACCESS_READ)
+        self._data = data = memoryview(self._map)
+        if len(data) < self.HEADER or data[:len(self.MAGIC)] != self.MAGIC:
+            self.close()
+            raise ValueError(f'{path} is not a public key file')
+        pos = len(self.MAGIC)
+        self.count = int.from_bytes(data[pos:pos + 4], 'little')
+        self.block = int.from_bytes(data[pos + 4:pos + 8], 'little')
+        if data[pos + 8:self.HEADER] != parameters_digest(action) or len(data) != self.HEADER + self.count * self.block:
+            self.close()
+            raise ValueError(f'{path} does not contain public keys of the given action')
+        self._keys = [None] * self.count
+
+    @classmethod
+    def write(cls, action, path, keys):
+        """
+        Writes the keys (an iterable of set elements, consumed one at a time)
+        to path and returns the store mapping it. The file is replaced
+        atomically, so processes that already mapped it are not affected.
+        """
+        tmp = f'{path}.{os.getpid()}.tmp'
+        count, block = 0, action.set_costs()
+        try:
+            with open(tmp, 'wb') as f:
+                f.write(bytes(cls.HEADER))
+                for key in keys:
+                    data = key.to_bytes()
+                    if len(data) != block:
+                        raise ValueError(f'public key of {len(data)} bytes instead of {block}')
+                    f.write(data)
+                    count += 1
+                f.seek(0)
+                f.write(cls.MAGIC + count.to_bytes(4, 'little') + block.to_bytes(4, 'little') + parameters_digest(action))
+            os.replace(tmp, path)
+        finally:
+            # nothing is left behind if the keys can not be written
+            if os.path.exists(tmp):
+                os.remove(tmp)
+        return cls(action, path)
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self.count
+        if not 0 <= i < self.count:
+            raise IndexError(f'Public key {i} out of range')
+        key = self._keys[i]
+        if key is None:
+            # parsing the same key twice in two threads is harmless
+            start = self.HEADER + i * self.block
+            key = self.action.set_from_bytes(self._data[start:start + self.block])
+            self._keys[i] = key
+        return key
+
+    def __iter__(self):
+        return (self[i] for i in range(self.count))
+
+    def to_bytes(self):
+        """
+        Concatenated serializations of the keys, as `GRASS.serialize_public_key`.
+        """
+        return bytes(self._data[self.HEADER:])
+
+    def close(self):
+        if getattr(self, '_data', None) is not None:
+            self._data.release()
+            self._data = None
+        self._map.close()
+
+    def __reduce__(self):
+        return (PublicKeyStore, (self.action, self.path))
+
+    def __repr__(self):
+        return f'Public key store with {self.count} keys of {self.block} bytes in {self.path}'
+
+
+def parameters_digest(action):
+    return sha256(repr(action.cache_key()).encode()).digest()
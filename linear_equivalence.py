@@ -9,8 +9,17 @@ from sage.rings.finite_rings.finite_field_constructor import GF
 from sage.matrix.constructor import diagonal_matrix, matrix
 #from sage.matrix.matrix2 import rref
 from sage.coding.linear_code import LinearCode
+from sage.misc.cachefunc import cached_method
+from sage.structure.parent import Parent
+from sage.structure.element import parent
+from sage.categories.objects import Objects
 
-from general_purpose import cmt
+from action import CryptoAction
+
+from general_purpose import cmt, to_hex, pack_ints, unpack_ints, bit_length, PRG
+from prime_field import inverse_table, systematic_form
+from functools import lru_cache
+import numpy as np
 
 
 
@@ -20,17 +29,52 @@ def SF(G):
     if k > n:
         print(f'[SF DEBUG] matrix G is {k}x{n}, not horizontal, transposing it')
         return SF(G.transpose())
-    sol = G.rref()
-    if sol[:,:k].is_singular():
+    F = G.base_ring()
+    sol = systematic_form(G.numpy(dtype = np.int64), F.order())
+    if sol is None:
         raise ValueError('input matrix without systematic form')
-    return sol
+    return matrix(F, sol.tolist())
+
+def CF(V, q):
+    """
+    Canonical form of the non-pivot block V of a systematic generator
+    [I_k | V] over GF(q), invariant under permutations and scalings of the
+    rows and of the columns of V (so under every monomial map that keeps
+    the information set).
+
+    For every column j with no zero entries the rows are scaled to make
+    column j all ones, then every column is scaled to have sum one and the
+    columns are sorted by their multiset of entries (ties are not allowed)
+    and the rows lexicographically; the smallest of these matrices is the
+    canonical form. Returns None when no column gives a valid candidate.
+    """
+    V = np.asarray(V, dtype = np.int64)
+    inv = inverse_table(q)
+    best, best_key = None, None
+    for j in np.flatnonzero(np.all(V != 0, axis = 0)):
+        W = (V * inv[V[:, j]][:, None]) % q
+        sums = W.sum(axis = 0) % q
+        if not np.all(sums):
+            continue
+        W = (W * inv[sums][None, :]) % q
+        keys = np.sort(W, axis = 0)
+        order = np.lexsort(keys[::-1])
+        keys = keys[:, order]
+        if np.any(np.all(keys[:, 1:] == keys[:, :-1], axis = 0)):
+            continue
+        W = W[:, order]
+        W = W[np.lexsort(W.T[::-1])]
+        key = W.astype('>u4').tobytes()
+        if best_key is None or key < best_key:
+            best, best_key = W, key
+    return best
 
 class CryptoLinearCode(LinearCode):
     """
     Child class to sage.coding.linear_code.LinearCode with specific 
     functions for Cryptographic use meant for using code equivalence.
 
-    The class should be adapted to handle also Canonical Forms
+    Canonical forms are handled by `CF` and `LCE.canonical`.
     """
     def __init__(self, n, k, q, G = None, SEED = None, lam = 128):
         self.n = n
@@ -38,71 +82,214 @@ class CryptoLinearCode(LinearCode):
         self.q = q
         self.F = GF(q)
         self.lam = lam
-        if G:
-            if G[:,:k].is_singular():
+        if G is not None:
+            # G is either a sage matrix or a numpy array, the systematic form
+            # is computed (and singularity detected) in a single elimination
+            if not isinstance(G, np.ndarray):
+                G = G.numpy(dtype = np.int64)
+            self._sf = systematic_form(G, q)
+            if self._sf is None:
                 raise ValueError('input matrix without systematic form')
-            super().__init__(G)
         else:
-            with seed(SEED): G = random_matrix(self.F,k,n)
-            while G[:,:k].is_singular():
-                with seed(SEED): SEED = randint(0,2**self.lam - 1)
-                with seed(SEED): G = random_matrix(self.F,k,n)
-            super().__init__(G)
+            # uniform code with information set range(k), sampled directly in systematic form
+            self._sf = PRG(SEED, lam = self.lam).systematic_generator(k, n, q)
+        self._sf.setflags(write = False)
         # here we rewrite the internal matrix so that only the sf one is stored
-        self._generator_matrix = self.systematic_generator_matrix()
+        G = matrix(self.F, self._sf.tolist())
+        super().__init__(G)
+        self._generator_matrix = G
 
     def __repr__(self):
         sup_repr = super().__repr__()
-        return f'{sup_repr} with hashed generator matrix = {cmt(self._generator_matrix,lam = self.lam)}'
+        return f'{sup_repr} with hashed generator matrix = {to_hex(cmt(self, lam = self.lam))}'
 
     @cached_method
+    def to_bytes(self):
+        """
+        Packed non-systematic part of the generator matrix, each entry
+        on ceil(log2(q)) bits.
+        """
+        return pack_ints(self._sf[:, self.k:], bit_length(self.q))
+
+    def generator(self):
+        """
+        Systematic generator matrix as a (read only) numpy array.
+        """
+        return self._sf
+
     def get_action(self):
-        action = LCE(n = self.n, k = self.k, q = self.q)
-        return action
+        return get_lce(n = self.n, k = self.k, q = self.q)
 
     def act(self, Q):
         action = self.get_action()
         return action.act(Q, self)
 
 
+class SystematicCode():
+    """
+    Lightweight immutable [n, k]_q code, stored as the non-pivot block V
+    of its systematic generator matrix [I_k | V].
+
+    Its generator matrix, byte serialization and hash are computed once, the
+    corresponding `CryptoLinearCode` is only built when asked with `to_linear_code`.
+    """
+    __slots__ = ('n', 'k', 'q', 'V', '_generator', '_bytes', '_hash', '_code')
+
+    def __init__(self, n, k, q, V):
+        V = np.array(V, dtype = np.int64) % q
+        if V.shape != (k, n - k):
+            raise ValueError(f'non-pivot block of shape {V.shape} instead of {(k, n - k)}')
+        V.setflags(write = False)
+        self.n = n
+        self.k = k
+        self.q = q
+        self.V = V
+        self._generator = None
+        self._bytes = None
+        self._hash = None
+        self._code = None
+
+    @classmethod
+    def from_generator(cls, G, q, overwrite = False):
+        """
+        Code generated by the k x n numpy matrix G, raises ValueError
+        if G has no systematic form on the first k columns.
+        """
+        k, n = G.shape
+        sf = systematic_form(G, q, overwrite = overwrite)
+        if sf is None:
+            raise ValueError('input matrix without systematic form')
+        return cls(n, k, q, sf[:, k:])
+
+    @classmethod
+    def from_bytes(cls, n, k, q, data):
+        """
+        Inverse of `to_bytes`.
+        """
+        bits = bit_length(q)
+        if len(data) != (k * (n - k) * bits + 7) // 8:
+            raise ValueError(f'{len(data)} bytes do not encode a [{n}, {k}]_{q} code')
+        V = unpack_ints(data, bits, k * (n - k)).reshape(k, n - k)
+        if np.any(V >= q):
+            raise ValueError('entries of the code out of range')
+        return cls(n, k, q, V)
+
+    def generator(self):
+        """
+        Systematic generator matrix [I_k | V] (read only numpy array).
+        """
+        if self._generator is None:
+            G = np.empty((self.k, self.n), dtype = np.int64)
+            G[:, :self.k] = np.eye(self.k, dtype = np.int64)
+            G[:, self.k:] = self.V
+            G.setflags(write = False)
+            self._generator = G
+        return self._generator
+
+    def to_bytes(self):
+        if self._bytes is None:
+            self._bytes = pack_ints(self.V, bit_length(self.q))
+        return self._bytes
+
+    def __hash__(self):
+        if self._hash is None:
+            self._hash = hash((self.n, self.k, self.q, self.to_bytes()))
+        return self._hash
+
+    def __eq__(self, C):
+        return isinstance(C, SystematicCode) and (self.n, self.k, self.q) == (C.n, C.k, C.q) and self.to_bytes() == C.to_bytes()
+
+    def __repr__(self):
+        return f'Systematic [{self.n}, {self.k}]_{self.q} code with hashed generator matrix = {to_hex(cmt(self))}'
+
+    def to_linear_code(self):
+        if self._code is None:
+            self._code = CryptoLinearCode(self.n, self.k, self.q, G = self.generator())
+        return self._code
+
+    def get_action(self):
+        return get_lce(n = self.n, k = self.k, q = self.q)
+
+    def act(self, Q):
+        return self.get_action().act(Q, self)
+
+
 
 
 
 
 class MonomialMap(Parent):
+    """
+    Monomial map stored as a permutation array and a scaling array (numpy
+    integer arrays, the scalings are non zero modulo q).
+
+    It acts on the right on k x n matrices mapping the column j of G
+    to diag[j] * G[:, perm[j]], i.e. G -> G * to_matrix().
+    """
     def __init__(self,n,q,P = None, D = None, SEED = None):
         self.n = n
         self.q = q
-        self.F = GF(q)
-        self.V = self.F**n
-        if not P:
-            with seed(SEED): P = Permutations(n).random_element()
-        if not D:
-            with seed(SEED): D = self.V([randint(1,q-1) for _ in range(n)])
-        self.perm = P
-        self.diag = D
+        if P is None or D is None:
+            prg = PRG(SEED)
+        if P is None:
+            P = prg.permutation(n)
+        if D is None:
+            D = prg.vector_mod(n, q, nonzero = True)
+        self.perm = np.asarray(P, dtype = np.int64)
+        self.diag = np.asarray(D, dtype = np.int64) % q
+
+    @property
+    def F(self):
+        return GF(self.q)
 
     def to_matrix(self):
-        return (self.perm.to_matrix())*diagonal_matrix(self.diag)
+        M = matrix(self.F, self.n, self.n)
+        for (j, (i, a)) in enumerate(zip(self.perm, self.diag)):
+            M[int(i), j] = int(a)
+        return M
+
+    def apply(self, G):
+        """
+        Applies the map to the columns of the numpy matrix G in O(k*n).
+        """
+        return (G[:, self.perm] * self.diag) % self.q
 
     def __repr__(self):
-        return f'Monomial map permuting with {self.perm} and rescaling by {self.diag}'
+        return f'Monomial map permuting with {self.perm.tolist()} and rescaling by {self.diag.tolist()}'
+
+    def to_bytes(self):
+        return pack_ints(self.perm, bit_length(self.n)) + pack_ints(self.diag, bit_length(self.q))
+
+    @classmethod
+    def from_bytes(cls, n, q, data):
+        """
+        Inverse of `to_bytes`, data can be a memoryview (it is not copied).
+        """
+        split = (n * bit_length(n) + 7) // 8
+        if len(data) != split + (n * bit_length(q) + 7) // 8:
+            raise ValueError(f'{len(data)} bytes do not encode a monomial map of length {n} over GF({q})')
+        P = unpack_ints(data[:split], bit_length(n), n)
+        D = unpack_ints(data[split:], bit_length(q), n)
+        if not np.array_equal(np.sort(P), np.arange(n)) or np.any(D == 0) or np.any(D >= q):
+            raise ValueError('invalid monomial map')
+        return cls(n, q, P = P, D = D)
 
     def __mul__(self,Q):
-        return MonomialMap(n = self.n, q = self.q, P =  Q.perm * self.perm, D = self.V((Q.perm).action(self.diag)).pairwise_product(Q.diag))
+        # self is applied first, then Q
+        return MonomialMap(n = self.n, q = self.q, P = self.perm[Q.perm], D = (self.diag[Q.perm] * Q.diag) % self.q)
 
     def inverse(self):
-        D = self.V((self.perm.inverse()).action(self.diag))
-        return MonomialMap(n = self.n, q = self.q, P =  self.perm.inverse(), D = self.V([ a**-1 for a in D]))
+        P = np.argsort(self.perm)
+        return MonomialMap(n = self.n, q = self.q, P = P, D = inverse_table(self.q)[self.diag[P]])
 
     def __truediv__(self, Q):
         return self * Q.inverse()
 
     def __eq__(self,Q):
-        return self.perm == Q.perm and self.diag == Q.diag
+        return np.array_equal(self.perm, Q.perm) and np.array_equal(self.diag, Q.diag)
 
     def is_one(self):
-        return self.perm.is_one() and set(self.diag) == {1}
+        return np.array_equal(self.perm, np.arange(self.n)) and bool(np.all(self.diag == 1))
 
 
 class LCE(CryptoAction):
@@ -111,29 +298,81 @@ class LCE(CryptoAction):
         self.k = k
         self.q = q
         self.F = GF(q)
-        P = MonomialMap(n,q)
-        C = CryptoLinearCode(n, k, q, SEED = 1)
-        super().__init__(parent(P),category(C),security, is_left = False)
+        # the identity map is enough to find the parent, set elements are SystematicCode objects
+        P = MonomialMap(n, q, P = np.arange(n), D = np.ones(n))
+        super().__init__(parent(P),Objects(),security, is_left = False)
+
+    def __reduce__(self):
+        # rebuilt from its parameters, e.g. when sent to worker processes
+        return (LCE, (self.n, self.k, self.q, self.security))
 
     def rand_group(self, SEED = None):
         return MonomialMap(self.n,self.q,SEED = SEED)
 
     def rand_set(self, SEED = None):
-        return CryptoLinearCode(n = self.n, k = self.k, q = self.q, SEED = SEED)
+        # uniform code with information set range(k), sampled directly in systematic form
+        V = PRG(SEED, lam = self.security).matrix_mod(self.k, self.n - self.k, self.q)
+        return SystematicCode(self.n, self.k, self.q, V)
+
+    def set_from_bytes(self, data):
+        return SystematicCode.from_bytes(self.n, self.k, self.q, data)
+
+    def group_from_bytes(self, data):
+        return MonomialMap.from_bytes(self.n, self.q, data)
 
     def act(self,Q,C):
-        if Q in ZZ:
+        if not isinstance(Q, MonomialMap):
             Q = MonomialMap(n = self.n,q = self.q, SEED = Q)
-        G_out = C.generator_matrix()*Q.to_matrix()
-        OUT = CryptoLinearCode(n = C.n, k = C.k, q = C.q, G = G_out)
-        return OUT
+        # permute and rescale the columns directly instead of multiplying by Q.to_matrix(),
+        # the output is a SystematicCode so that no sage object is built
+        G_out = Q.apply(C.generator())
+        return SystematicCode.from_generator(G_out, self.q, overwrite = True)
+
+    def canonical(self, C):
+        """
+        Canonical form (see `CF`) of the code C as a SystematicCode,
+        None if C has no canonical form.
+        """
+        V = CF(C.generator()[:, self.k:], self.q)
+        if V is None:
+            return None
+        return SystematicCode(self.n, self.k, self.q, V)
+
+    def canonical_response(self, Q):
+        """
+        Information set of C which is sent to the first k columns of C*Q:
+        it is all is needed to recompute the canonical form of C*Q from C.
+        """
+        return np.sort(Q.perm[:self.k])
+
+    def canonical_act(self, J, C):
+        """
+        Canonical form of the code C*Q, given only the information set
+        J = canonical_response(Q). Returns None if J is not an information set
+        (given as k strictly increasing columns, its only encoding).
+        """
+        J = np.asarray(J)
+        if J.shape != (self.k,) or J[0] < 0 or J[-1] >= self.n or np.any(np.diff(J) <= 0):
+            return None
+        G = C.generator()
+        rest = np.setdiff1d(np.arange(self.n), J)
+        sf = systematic_form(np.concatenate([G[:, J], G[:, rest]], axis = 1), self.q, overwrite = True)
+        if sf is None:
+            return None
+        V = CF(sf[:, self.k:], self.q)
+        if V is None:
+            return None
+        return SystematicCode(self.n, self.k, self.q, V)
 
     def _act_(self,Q,C):
         """
         Does not work when Q is a seed!
         """
-        if Q in ZZ:
+        if not isinstance(Q, MonomialMap):
             Q = MonomialMap(n = self.n,q = self.q, SEED = Q)
         return self.act(Q,C)
 
 
+@lru_cache(maxsize = None)
+def get_lce(n, k, q):
+    return LCE(n = n, k = k, q = q)
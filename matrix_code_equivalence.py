@@ -9,6 +9,14 @@ from sage.rings.rational import Rational
 from sage.rings.finite_rings.finite_field_constructor import GF
 from sage.matrix.constructor import diagonal_matrix, matrix
 
+from sage.structure.element import parent
+from sage.categories.objects import Objects
+
+from action import CryptoAction
+
+from general_purpose import pack_ints, unpack_ints, bit_length, PRG
+from prime_field import systematic_form, inverse
+import numpy as np
 
 
 def vec(M):
@@ -24,73 +32,142 @@ def vec_t(M):
 # We need to define it from scractch since the LinearRankMetricCode 
 # class in sagemath is inteded for F_{q^m}-linerar codes
 class MatrixCode():
+    """
+    [m*n, k]_q matrix code, stored as the k x m x n tensor (numpy, entries in
+    range(q)) of the codewords of its systematic generator matrix.
+    """
     def __init__(self, n, m, k, q, SEED = None, G = None):
         self.n = n
         self.m = m
         self.k = k
         self.q = q
-        self.F = GF(q)
-        if G:
-            self.generator_matrix = G
+        if G is not None:
+            if not isinstance(G, np.ndarray):
+                G = G.numpy(dtype = np.int64)
+            sf = systematic_form(G, q)
+            if sf is None:
+                raise ValueError('input matrix without systematic form')
         else:
-            if SEED:
-                with seed(SEED): self.generator_matrix = random_matrix(self.F, self.k, self.n * self.m)
-            else:
-                self.generator_matrix = random_matrix(self.F, self.k, self.n * self.m)
-        self.generator_matrix = SF(self.generator_matrix)
+            # uniform code with information set range(k), sampled directly in systematic form
+            sf = PRG(SEED).systematic_generator(self.k, self.n * self.m, self.q)
+        self._set_generator(sf)
+
+    @classmethod
+    def from_systematic(cls, n, m, k, q, sf):
+        """
+        Builds the code from a k x mn generator already in systematic form.
+        """
+        C = cls.__new__(cls)
+        C.n, C.m, C.k, C.q = n, m, k, q
+        C._set_generator(sf)
+        return C
+
+    @classmethod
+    def from_bytes(cls, n, m, k, q, data):
+        """
+        Inverse of `to_bytes`.
+        """
+        bits = bit_length(q)
+        count = k * (m * n - k)
+        if len(data) != (count * bits + 7) // 8:
+            raise ValueError(f'{len(data)} bytes do not encode a [{m}*{n},{k}]_{q} matrix code')
+        sf = np.zeros((k, m * n), dtype = np.int64)
+        sf[:, :k] = np.eye(k, dtype = np.int64)
+        sf[:, k:] = unpack_ints(data, bits, count).reshape(k, m * n - k)
+        if np.any(sf >= q):
+            raise ValueError('entries of the code out of range')
+        return cls.from_systematic(n, m, k, q, sf)
+
+    def _set_generator(self, sf):
+        sf.setflags(write = False)
+        self.codewords = sf.reshape(self.k, self.m, self.n)
+
+    def generator(self):
+        return self.codewords.reshape(self.k, self.m * self.n)
+
+    @property
+    def F(self):
+        return GF(self.q)
+
+    @property
+    def generator_matrix(self):
+        return matrix(self.F, self.generator().tolist())
 
     def to_matrix():
         pass
 
     def to_list(self):
-        return [ matrix(self.F,self.m,self.n,v) for v in self.generator_matrix]
+        return [ matrix(self.F, M.tolist()) for M in self.codewords]
 
     def __repr__(self):
         return f'Matrix [{self.m}*{self.n},{self.k}]_{self.q} code generated by {self.generator_matrix}'
 
+    def to_bytes(self):
+        return pack_ints(self.generator()[:, self.k:], bit_length(self.q))
+
+    def __eq__(self, C):
+        return isinstance(C, MatrixCode) and (self.n, self.m, self.k, self.q) == (C.n, C.m, C.k, C.q) and self.to_bytes() == C.to_bytes()
+
+    def __hash__(self):
+        return hash(self.to_bytes())
+
 
 
 
 class MatrixCodeIsomorphism():
     # perhaps switch to isometry instead of isomorphism?
+    """
+    Pair of invertible matrices (A, B) (numpy arrays modulo q) acting on the
+    right on matrix codes by C -> A * C * B on every codeword.
+    """
     def __init__(self, n, m, q, SEED = None, A = None, B = None):
         self.n = n
         self.m = m
         self.q = q
-        self.F = GF(q)
 
-        if A and B:
-            self.A = A
-            self.B = B
+        if A is not None and B is not None:
+            self.A = np.asarray(A if isinstance(A, np.ndarray) else A.numpy(dtype = np.int64), dtype = np.int64) % q
+            self.B = np.asarray(B if isinstance(B, np.ndarray) else B.numpy(dtype = np.int64), dtype = np.int64) % q
         else:
-            if SEED:
-                with seed(SEED): 
-                    self.A = random_matrix(self.F, self.m)
-                    while self.A.is_singular():
-                        self.A = random_matrix(self.F, self.m)
-                    self.B = random_matrix(self.F, self.n)
-                    while self.B.is_singular():
-                        self.B = random_matrix(self.F, self.n)
-
-            else:
-                self.A = random_matrix(self.F, self.m)
-                while self.A.is_singular():
-                    self.A = random_matrix(self.F, self.m)
-                self.B = random_matrix(self.F, self.n)
-                while self.B.is_singular():
-                    self.B = random_matrix(self.F, self.n)
+            prg = PRG(SEED)
+            self.A = prg.invertible_matrix(self.m, self.q)
+            self.B = prg.invertible_matrix(self.n, self.q)
+
+    @property
+    def F(self):
+        return GF(self.q)
 
     def __mul__(self,isom):
-        return MatrixCodeIsomorphism(n = self.n, m = self.m, q = self.q, A = self.A * isom.A, B = isom.B * self.B)
+        # self is applied first, then isom
+        return MatrixCodeIsomorphism(n = self.n, m = self.m, q = self.q, A = (isom.A @ self.A) % self.q, B = (self.B @ isom.B) % self.q)
 
     def inverse(self):
-        return MatrixCodeIsomorphism(n = self.n, m = self.m, q = self.q, A = self.A.inverse(), B = self.B.inverse())
+        return MatrixCodeIsomorphism(n = self.n, m = self.m, q = self.q, A = inverse(self.A, self.q), B = inverse(self.B, self.q))
 
     def __repr__(self):
         return f'MatrixCodeIsomorphism represented by the matrices\n{self.A}\nand\n{self.B}'
 
+    def to_bytes(self):
+        bits = bit_length(self.q)
+        return pack_ints(self.A, bits) + pack_ints(self.B, bits)
+
+    @classmethod
+    def from_bytes(cls, n, m, q, data):
+        """
+        Inverse of `to_bytes`, data can be a memoryview (it is not copied).
+        """
+        bits = bit_length(q)
+        split = (m * m * bits + 7) // 8
+        if len(data) != split + (n * n * bits + 7) // 8:
+            raise ValueError(f'{len(data)} bytes do not encode an isomorphism of {m}x{n} matrix codes over GF({q})')
+        A = unpack_ints(data[:split], bits, m * m).reshape(m, m)
+        B = unpack_ints(data[split:], bits, n * n).reshape(n, n)
+        if np.any(A >= q) or np.any(B >= q):
+            raise ValueError('entries of the isomorphism out of range')
+        return cls(n, m, q, A = A, B = B)
+
     def __eq__(self,Q):
-        return self.A == Q.A and self.B == Q.B
+        return np.array_equal(self.A, Q.A) and np.array_equal(self.B, Q.B)
 
 
 class MCE(CryptoAction):
@@ -100,9 +177,13 @@ class MCE(CryptoAction):
         self.k = k
         self.q = q
         self.F = GF(q)
-        P = MatrixCodeIsomorphism(n, m, q)
-        G = MatrixCode(n,m,k,q)
-        super().__init__(parent(P),parent(G),security)
+        # the identity is enough to find the parent, set elements are MatrixCode objects
+        P = MatrixCodeIsomorphism(n, m, q, A = np.eye(m, dtype = np.int64), B = np.eye(n, dtype = np.int64))
+        super().__init__(parent(P),Objects(),security, is_left = False)
+
+    def __reduce__(self):
+        # rebuilt from its parameters, e.g. when sent to worker processes
+        return (MCE, (self.n, self.m, self.k, self.q, self.security))
 
     def rand_group(self, SEED = None):
         return MatrixCodeIsomorphism(n = self.n, m = self.m, q = self.q, SEED = SEED)
@@ -110,19 +191,23 @@ class MCE(CryptoAction):
     def rand_set(self, SEED = None):
         return MatrixCode(n = self.n, m = self.m, k = self.k, q = self.q, SEED = SEED)
 
+    def set_from_bytes(self, data):
+        return MatrixCode.from_bytes(self.n, self.m, self.k, self.q, data)
+
+    def group_from_bytes(self, data):
+        return MatrixCodeIsomorphism.from_bytes(self.n, self.m, self.q, data)
+
     def act(self,AB,C : MatrixCode):
-        if AB in ZZ:
-            AB = self.rand_group(SEED = Q) 
-        code = C.to_list()
-        code = [ AB.A * M * AB.B for M in code]
-        out = C.deepcopy()
-        out.generator_matrix = SF(matrix(G.F,[M.list() for M in code]))
-        # [A * C * B for C in code]
-        return out
+        if not isinstance(AB, MatrixCodeIsomorphism):
+            AB = self.rand_group(SEED = AB)
+        q = self.q
+        # two batched products over the k x m x n tensor of codewords
+        code = (np.matmul(AB.A, C.codewords) % q)
+        code = (np.matmul(code, AB.B) % q).reshape(self.k, self.m * self.n)
+        sf = systematic_form(code, q, overwrite = True)
+        if sf is None:
+            raise ValueError('input matrix without systematic form')
+        return MatrixCode.from_systematic(self.n, self.m, self.k, q, sf)
 
     def _act_(self,AB,C : MatrixCode):
         return self.act( AB, C )
-
-
-
-
@@ -0,0 +1,325 @@
+# Python imports
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from threading import Lock
+
+from general_purpose import cmt, MerkleTree, SeedTree, seeds_from_cover, tail_cover_root, tree_size
+from parameters import RETRY_BITS
+
+
+def round_salt(salt, idx):
+    """
+    Salt of the seed tree and of the Merkle tree of the idx-th round
+    (MPC-in-the-Head), derived from the fresh salt of the signature.
+    """
+    return bytes(salt) + b'round' + idx.to_bytes(4, 'little')
+
+# bound on the number of times a round secret is replaced
+MAX_RETRIES = 64
+
+def next_seed(seed, lam = 128):
+    """
+    Seed replacing a round secret whose set element has no systematic
+    (or canonical) form. The replacement is deterministic, so that the
+    verifier recomputes it from the revealed seed.
+    """
+    return cmt([b'retry', seed], lam = lam)
+
+def retries(leaf, seed, lam = 128):
+    """
+    Number of times `next_seed` sends leaf to seed (None if it never does
+    within MAX_RETRIES replacements).
+    """
+    for k in range(MAX_RETRIES):
+        if leaf == seed:
+            return k
+        leaf = next_seed(leaf, lam = lam)
+    return None
+
+def party_seeds(root, salt, idx, N, lam = 128):
+    """
+    Seeds of the N parties of the idx-th round, leaves of the seed tree with the given root.
+    """
+    return SeedTree(N, SALT = round_salt(salt, idx), SEED = root, lam = lam).leaves
+
+
+class RoundContext(namedtuple('RoundContext', ['action', 'origin', 'pk', 'canonical', 'lam', 'N', 'skip', 'skip_left', 'fixed_weight'],
+                              defaults = (None, False, True, False))):
+    """
+    Everything needed to evaluate a round of GRASS: the action, the origin,
+    the public key and the commitment settings (N is the number of parties
+    with MPC-in-the-Head, None otherwise, skip tells whether the
+    verifier skips the left or right edges of the chain and fixed_weight
+    whether the secrets of the zero rounds are leaves of the seed tree of
+    the signature). It contains no secret, so it can be shipped once to the
+    worker processes.
+    """
+    __slots__ = ()
+
+    def max_retries(self):
+        """
+        Number of seeds tried for a round secret. With fixed weight and
+        skipped edges the verifier of a zero round only recomputes the last
+        element of the chain, so it can not replay the replacements due to
+        the other ones: their number is sent on RETRY_BITS bits.
+        """
+        if self.fixed_weight and self.skip:
+            return 2**RETRY_BITS
+        return MAX_RETRIES
+
+    def element(self, g, c):
+        """
+        Set element reached applying g to the origin (c = 0) or to the
+        c-th public key. For c = 0, g is a seed or a group element; for c > 0
+        in canonical mode g is the information set given by `canonical_response`.
+
+        Returns:
+        - The (canonical form of the) set element, None if it does not exist.
+        """
+        A = self.action
+        X = self.origin if c == 0 else self.pk[c - 1]
+        try:
+            if self.canonical and c != 0:
+                return A.canonical_act(g, X)
+            Y = A.act(g, X)
+        except (ValueError, IndexError):
+            return None
+        if self.canonical:
+            return A.canonical(Y)
+        return Y
+
+    def chain(self, g, c, idx, salt = b''):
+        """
+        Digests of the elements x_1, ..., x_N of the MPC-in-the-Head chain of
+        the idx-th round, x_i is x_{i-1} acted on by the element of the i-th
+        party and x_0 is the origin. For c = 0, g is the root of the seed tree
+        of the parties; for c = (key, j), g is the pair (cover, h) where the
+        cover gives all the seeds but the j-th one and x_j = h applied to the
+        key-th public key. Each element is hashed as soon as it is computed.
+
+        Returns:
+        - list: Digests of the chain, None if the response is not valid.
+        """
+        A = self.action
+        try:
+            if c == 0:
+                seeds, j = party_seeds(g, salt, idx, self.N, lam = self.lam), 0
+            else:
+                (key, j), (cover, h) = c, g
+                seeds = seeds_from_cover(self.hidden(c), cover, round_salt(salt, idx), self.N, lam = self.lam)
+            digests = []
+            x = self.origin
+            for i in range(1, self.N + 1):
+                x = A.act(h, self.pk[key - 1]) if i == j else A.act(seeds[i - 1], x)
+                digests.append(cmt(x, lam = self.lam))
+        except (ValueError, IndexError, TypeError):
+            return None
+        return digests
+
+    def span(self, c):
+        """
+        Leaves (first, last excluded) of the chain recomputed by the verifier
+        for the challenge c with skipped edges, the others are given by a
+        tail cover. For c = 0 only the last (left skip) or first (right skip)
+        element is recomputed, for c = (key, j) the chain from x_j to x_N
+        (left skip) or from x_1 to x_j (right skip).
+        """
+        if c == 0:
+            j = self.N if self.skip_left else 1
+        else:
+            j = c[1]
+        return (j - 1, self.N) if self.skip_left else (0, j)
+
+    def hidden(self, c):
+        """
+        Parties of the non-zero challenge c = (key, j) whose seeds are not
+        revealed: the j-th one, and with skipped edges also the ones on the
+        side of the chain replaced by the tail cover.
+        """
+        j = c[1]
+        if not self.skip:
+            return [j - 1]
+        return range(j) if self.skip_left else range(j - 1, self.N)
+
+    def tail(self, c):
+        """
+        Number of leaves of the tail cover revealed for the challenge c with
+        skipped edges (the right tail is counted in the padded tree).
+        """
+        first, last = self.span(c)
+        return first if self.skip_left else tree_size(self.N)[0] - last
+
+    def skipped_chain(self, g, c, idx, salt = b''):
+        """
+        Digests of the elements of the chain in `span(c)`. For c = 0, g is the
+        pair (root, tail cover) and the only element is obtained with a single
+        action of the product of the elements of the parties; for c = (key, j),
+        g is (cover, h, tail cover) where the cover gives the seeds of the
+        parties on the recomputed side of x_j.
+
+        Returns:
+        - list: Digests of the recomputed elements, None if the response is not valid.
+        """
+        A = self.action
+        first, last = self.span(c)
+        try:
+            if c == 0:
+                seeds = party_seeds(g[0], salt, idx, self.N, lam = self.lam)
+                if self.skip_left:
+                    h = A.rand_group(SEED = seeds[0])
+                    for seed in seeds[1:]:
+                        h = h * A.rand_group(SEED = seed)
+                    return [cmt(A.act(h, self.origin), lam = self.lam)]
+                return [cmt(A.act(seeds[0], self.origin), lam = self.lam)]
+            (key, j), (cover, h, _) = c, g
+            seeds = seeds_from_cover(self.hidden(c), cover, round_salt(salt, idx), self.N, lam = self.lam)
+            digests = []
+            x = self.pk[key - 1] if self.skip_left else self.origin
+            for i in range(first + 1, last + 1):
+                x = A.act(h, self.pk[key - 1]) if i == j else A.act(seeds[i - 1], x)
+                digests.append(cmt(x, lam = self.lam))
+        except (ValueError, IndexError, TypeError):
+            return None
+        return digests
+
+    def commit_round(self, seed, idx, salt = b''):
+        """
+        Signer side of the round idx: replaces the round secret seed (with
+        `next_seed`) until it gives a valid element.
+
+        Returns:
+        - tuple: The final round secret and its commitment digest, or with
+          skipped edges the digests of its chain (None if no seed is valid).
+        """
+        for _ in range(self.max_retries()):
+            out = self.chain(seed, 0, idx, salt) if self.skip else self.round_digest(seed, 0, idx, salt)
+            if out is not None:
+                return seed, out
+            seed = next_seed(seed, lam = self.lam)
+        return seed, None
+
+    def digest(self, g, c, idx = 0, salt = b''):
+        """
+        Commitment digest of the round idx, see `round_digest`. For c = 0 the
+        revealed seed is replaced as done by the signer in `commit_round`:
+        with skipped edges g is (seed, tail cover) and the seed is already the
+        final one, or with fixed weight (leaf, retries) where the leaf of the
+        seed tree is replaced the given number of times.
+        """
+        if c != 0:
+            return self.round_digest(g, c, idx, salt)
+        if self.skip:
+            if self.fixed_weight:
+                try:
+                    seed, k = g
+                    if not 0 <= k < self.max_retries():
+                        return None
+                    for _ in range(k):
+                        seed = next_seed(seed, lam = self.lam)
+                except (TypeError, ValueError):
+                    return None
+                g = (seed,)
+            return self.round_digest(g, c, idx, salt)
+        d = self.round_digest(g, c, idx, salt)
+        for _ in range(MAX_RETRIES - 1):
+            if d is not None:
+                return d
+            try:
+                g = next_seed(g, lam = self.lam)
+            except TypeError:
+                return None
+            d = self.round_digest(g, c, idx, salt)
+        return d
+
+    def round_digest(self, g, c, idx = 0, salt = b''):
+        """
+        Commitment digest of the round idx: the digest of its set element,
+        or with MPC-in-the-Head the root of the Merkle tree of its chain
+        (recomputed from the tail cover with skipped edges), whose trees are
+        salted with the salt of the signature. With fixed weight and skipped
+        edges, the pair (digest of the last element, root), where the root of
+        a zero round is None: it is given by the cover of the tree of the
+        roots of the signature.
+        """
+        if self.N is not None and self.skip:
+            digests = self.skipped_chain(g, c, idx, salt)
+            if digests is None:
+                return None
+            if self.fixed_weight and c == 0:
+                return digests[-1], None
+            try:
+                root = tail_cover_root(g[-1], digests, self.tail(c), self.N, left = self.skip_left,
+                                       SALT = round_salt(salt, idx), lam = self.lam)
+            except (ValueError, TypeError):
+                return None
+            if self.fixed_weight and root is not None:
+                return digests[-1], root
+            return root
+        if self.N is not None:
+            digests = self.chain(g, c, idx, salt)
+            if digests is None:
+                return None
+            return MerkleTree(digests, SALT = round_salt(salt, idx), lam = self.lam).get_root()
+        x = self.element(g, c)
+        if x is None:
+            return None
+        return cmt(x, lam = self.lam)
+
+
+_CONTEXT = None
+
+def _init_worker(context):
+    global _CONTEXT
+    _CONTEXT = context
+
+def _task(method, task):
+    return getattr(_CONTEXT, method)(*task)
+
+
+class RoundExecutor():
+    """
+    Evaluates lists of rounds (g, c, idx, salt) returning their commitment digests,
+    sequentially or spreading them over a pool of `workers` processes in
+    chunks of `chunksize` rounds. The context is sent to every worker only
+    once, when the pool starts; tasks only carry seeds (integers) or
+    responses, results come back as bytes digests.
+    """
+    def __init__(self, context, workers = None, chunksize = 16):
+        self.context = context
+        self.workers = workers
+        self.chunksize = chunksize
+        self._pool = None
+        self._lock = Lock()
+
+    def map(self, tasks, method = 'digest'):
+        """
+        Evaluates `method` of the context (`digest`, or `chain` for the
+        Merkle trees of the signer) on every task.
+        """
+        if not self.workers or self.workers <= 1:
+            f = getattr(self.context, method)
+            return [f(*task) for task in tasks]
+        with self._lock:
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers = self.workers, initializer = _init_worker, initargs = (self.context,))
+            pool = self._pool
+        return list(pool.map(partial(_task, method), tasks, chunksize = self.chunksize))
+
+    def wave(self):
+        """
+        Number of tasks evaluated before the caller can drop the ones that
+        are no longer needed: a few chunks for every worker process.
+        """
+        if not self.workers or self.workers <= 1:
+            return self.chunksize
+        return 4 * self.chunksize * self.workers
+
+    def close(self, wait = True):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait = wait)
+
+    def __del__(self):
+        self.close(wait = False)
@@ -0,0 +1,234 @@
+# Python imports
+from functools import lru_cache
+from math import ceil, comb, lgamma, log, log2
+
+import numpy as np
+
+# same bound used by GRASS for the search of the number of rounds
+MAX_ROUNDS = 100000
+# bits of the number of replacements of the secret of a zero round sent with
+# fixed weight and skipped edges (see `parallel.RoundContext.max_retries`)
+RETRY_BITS = 2
+
+
+def log2_binomial(t, w):
+    return (lgamma(t + 1) - lgamma(w + 1) - lgamma(t - w + 1)) / log(2)
+
+@lru_cache(maxsize = None)
+def fixed_weight_rounds(lam, w, N = 1, num_public_keys = 1):
+    """
+    Minimal number of rounds t > w such that
+    binomial(t, w) * (N*num_public_keys)**w >= 2**lam, None if more than
+    MAX_ROUNDS rounds are needed.
+
+    The search is a binary search on log2(binomial(t, w)) computed with
+    lgamma, the boundary is then checked with exact integers.
+    """
+    base = N * num_public_keys
+    target = 2**lam
+
+    def enough(t):
+        return comb(t, w) * base**w >= target
+
+    lo, hi = w + 1, MAX_ROUNDS
+    if enough(lo):
+        return lo
+    if not enough(hi):
+        return None
+    offset = w * log2(base)
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if log2_binomial(mid, w) + offset >= lam:
+            hi = mid
+        else:
+            lo = mid
+    # fix the rounding errors of the floating point search
+    t = hi
+    while t > w + 1 and enough(t - 1):
+        t -= 1
+    while not enough(t):
+        t += 1
+    return t
+
+@lru_cache(maxsize = None)
+def rounds(lam, w = None, N = 1, num_public_keys = 1, fixed_weight = False):
+    """
+    Number of rounds and weight (number of non-zero challenges, on average
+    when fixed_weight is not set) reaching lam bits of security (the number
+    of rounds is None if the weight is too small to reach them).
+
+    Returns:
+    - tuple: (num_rounds, w).
+    """
+    if fixed_weight:
+        return fixed_weight_rounds(lam, w, N, num_public_keys), w
+    num_rounds = ceil(lam / log(num_public_keys*N + 1, 2))
+    w = ceil(num_rounds * (num_public_keys*N) / (num_public_keys*N + 1))
+    return num_rounds, w
+
+@lru_cache(maxsize = None)
+def _max_cover(real, capacity, hidden):
+    # max cover of a complete subtree with `capacity` leaves, the first
+    # `real` of them not padding, when `hidden` of the real ones are hidden
+    if hidden == 0:
+        return 1 if real > 0 else 0
+    if hidden == real:
+        return 0
+    half = capacity // 2
+    left, right = min(real, half), max(real - half, 0)
+    return max(_max_cover(left, half, h) + _max_cover(right, half, hidden - h)
+               for h in range(max(0, hidden - right), min(hidden, left) + 1))
+
+def max_cover(t, w):
+    """
+    Maximum number of seeds revealed by a seed tree with t leaves and w
+    hidden ones (see `general_purpose.seed_cover_indices`), over all the
+    choices of the hidden leaves: the covers are padded to this length,
+    so that fixed weight signatures have a fixed size.
+    """
+    if not 0 <= w <= t:
+        raise ValueError(f'Invalid input for the cover size {t =}, {w =}')
+    capacity = 1
+    while capacity < t:
+        capacity *= 2
+    return _max_cover(t, capacity, w)
+
+def _max_cover_grid(t, w, mask):
+    # max_cover evaluated once for each distinct pair (t, w) where mask is set
+    out = np.zeros(t.shape, dtype = np.int64)
+    pairs = np.stack([t[mask], w[mask]], axis = -1).reshape(-1, 2)
+    unique, inverse = np.unique(pairs, axis = 0, return_inverse = True)
+    out[mask] = np.array([max_cover(int(a), int(b)) for (a, b) in unique], dtype = np.int64)[inverse.ravel()]
+    return out
+
+def _rounds_grid(lam, w, N, num_public_keys, fixed_weight):
+    # the distinct settings are few even in large grids: `rounds` is
+    # evaluated (and memoized) once for each of them
+    base = N * num_public_keys
+    radix = int(base.max(initial = 0)) + 1
+    keys = (w * radix + base) * 2 + fixed_weight
+    unique, inverse = np.unique(keys, return_inverse = True)
+    out = []
+    for key in unique.tolist():
+        f, key = key % 2, key // 2
+        t, weight = rounds(lam, w = key // radix if f else None, N = key % radix, fixed_weight = bool(f))
+        # 0 rounds for the settings that can not reach lam bits
+        out.append((t or 0, weight))
+    out = np.array(out, dtype = np.int64).reshape(-1, 2)
+    inverse = inverse.reshape(w.shape)
+    return out[inverse, 0], out[inverse, 1]
+
+def size_grid(set_cost, group_cost, lam = 128, w = 0, N = 1, num_public_keys = 1, fixed_weight = False, skip = False, bytes = True, max = False):
+    """
+    Vectorized version of `GRASS.size`: all the settings (except lam, bytes
+    and max) can be numpy arrays and are broadcast together, so a whole
+    table of candidate parameters is evaluated in one call.
+
+    Parameters:
+    - set_cost, group_cost (array): Costs of set and group elements.
+    - w (array): Weight, only used where fixed_weight is set.
+    - N (array): Number of parties (MPC-in-the-Head for N > 1).
+    - num_public_keys (array): Number of public keys.
+    - fixed_weight (array of bool): Whether to use fixed weight.
+    - skip (array of bool): Whether to skip edges (left), only used for N > 1.
+    - bytes (bool): Whether to return sizes in bytes.
+    - max (bool): Whether to return the max (worst case) or average size of the signature.
+
+    Returns:
+    - dict: Arrays for the size of public key, signature, group actions (signing)
+      and verification group actions, with the number of rounds and the weight,
+      and `valid` telling which settings reach lam bits of security (the
+      costs of the other ones, with 0 rounds, are meaningless).
+    """
+    set_cost, group_cost, w, N, num_public_keys, fixed_weight, skip = np.broadcast_arrays(
+        np.asarray(set_cost, dtype = np.float64), np.asarray(group_cost, dtype = np.float64),
+        np.asarray(w, dtype = np.int64), np.asarray(N, dtype = np.int64),
+        np.asarray(num_public_keys, dtype = np.int64),
+        np.asarray(fixed_weight, dtype = bool), np.asarray(skip, dtype = bool))
+    w = np.where(fixed_weight, w, 0)
+    skip = skip & (N > 1)
+    t, w = _rounds_grid(lam, w, N, num_public_keys, fixed_weight)
+
+    if bytes:
+        lam = lam / 8
+    base = N * num_public_keys
+    # full group element and seed tree path of the MPC parties (the
+    # formulas for N = 1 are the ones without MPC-in-the-Head, log(N,2) = 0)
+    element = group_cost + np.ceil(np.log2(N)) * lam
+    # seeds of the padded cover of the zero rounds (exact, see max_cover)
+    # and general_purpose.l_tail
+    n_seed = _max_cover_grid(t, w, fixed_weight & (t > 0))
+    l_tail = np.log2(np.maximum(N - 1, 1))
+    if not max:
+        l_tail = l_tail / 2
+
+    # no use of fixed weight, rows 2 and 12 (17 and 18 with skipped edges, using (41) and (42))
+    if max:
+        plain = t * element + 3 * lam
+    else:
+        plain = t * np.ceil((1 - 1/(base + 1)) * element + (1/(base + 1)) * lam) + 3 * lam
+    plain = plain + np.where(skip, t * 2 * lam * l_tail, 0)
+    # fixed weight, rows 10 and 14 (19 and 20 with skipped edges): salt, challenge
+    # digest of 2 lam bits, padded cover and responses, the exact size of `GRASS.serialize`
+    # without skipped edges; with skipped edges the zero rounds add the padded cover
+    # of the tree of their roots and their retry counts, the others a tail cover
+    fw = w * element + n_seed * lam + 3 * lam
+    retries = np.ceil(RETRY_BITS * (t - w) / 8) * (1 if bytes else 8)
+    fw = fw + np.where(skip, n_seed * lam + retries + w * 2 * lam * l_tail, 0)
+
+    signing = t * N
+    verify = np.where(~skip, signing,
+                      np.where(fixed_weight, t + w * np.ceil((1 + N) / 2), t * np.ceil(1 + N / 2)))
+    return {
+        'pub_key' : np.ceil(set_cost * num_public_keys + lam).astype(np.int64),
+        'signature' : np.ceil(np.where(fixed_weight, fw, plain)).astype(np.int64),
+        'group_actions' : signing,
+        'ver_group_actions' : verify.astype(np.int64),
+        'num_rounds' : t,
+        'w' : w,
+        'valid' : t > 0,
+    }
+
+def sweep(set_cost, group_cost, lam = 128, num_public_keys = (1,), weights = (), parties = (1,), skip = False, bytes = True, max = False):
+    """
+    Evaluates the costs of all the GRASS settings obtained combining the
+    given numbers of public keys, weights (for fixed weight, the plain
+    setting is always included) and numbers of parties N (MPC-in-the-Head
+    is used for N > 1, with skipped edges if `skip` is set).
+
+    Returns:
+    - list: A dict for every setting with its parameters and `GRASS.size` costs,
+      the settings that can not reach lam bits (too small weights) are dropped.
+    """
+    settings = [(s, N, w) for s in num_public_keys for N in parties for w in [None] + list(weights)]
+    keys, Ns, ws = (np.array(column, dtype = np.int64) for column in
+                    zip(*[(s, N, w or 0) for (s, N, w) in settings]))
+    fixed_weight = np.array([w is not None for (s, N, w) in settings])
+    skip = bool(skip) & (Ns > 1)
+    costs = size_grid(set_cost, group_cost, lam = lam, w = ws, N = Ns, num_public_keys = keys,
+                      fixed_weight = fixed_weight, skip = skip, bytes = bytes, max = max)
+    out = []
+    for (i, (s, N, w)) in enumerate(settings):
+        if not costs['valid'][i]:
+            continue
+        out.append(dict(num_public_keys = s, fixed_weight = w is not None, w = int(costs['w'][i]), N = N,
+                        skip = bool(skip[i]), num_rounds = int(costs['num_rounds'][i]),
+                        **{key : int(costs[key][i]) for key in ('pub_key', 'signature', 'group_actions', 'ver_group_actions')}))
+    return out
+
+def pareto_front(points, x = 'signature', y = 'group_actions'):
+    """
+    Points (dicts) not dominated in both x and y, sorted by x.
+    """
+    front = []
+    for p in sorted(points, key = lambda p: (p[x], p[y])):
+        if not front or p[y] < front[-1][y]:
+            front.append(p)
+    return front
+
+def pareto(set_cost, group_cost, verify = False, **settings):
+    """
+    Pareto front of signature size against group actions (in signing,
+    or in verification when `verify` is set) over the settings of `sweep`.
+    """
+    return pareto_front(sweep(set_cost, group_cost, **settings), y = 'ver_group_actions' if verify else 'group_actions')
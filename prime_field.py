@@ -0,0 +1,82 @@
+# Python imports
+from functools import lru_cache
+import numpy as np
+
+# Linear algebra over prime fields GF(q) on numpy int64 arrays, entries are
+# always kept reduced in range(q).
+
+
+@lru_cache(maxsize = None)
+def inverse_table(q):
+    """
+    Returns the array of the inverses modulo the prime q (0 is sent to 0).
+    """
+    table = np.zeros(q, dtype = np.int64)
+    for x in range(1, q):
+        table[x] = pow(x, q - 2, q)
+    table.setflags(write = False)
+    return table
+
+def rank(M, q):
+    """
+    Rank of the matrix M over GF(q), M is not modified.
+    """
+    M = np.array(M, dtype = np.int64) % q
+    rows, cols = M.shape
+    inv = inverse_table(q)
+    r = 0
+    for c in range(cols):
+        if r == rows:
+            break
+        nonzero = np.flatnonzero(M[r:, c])
+        if not len(nonzero):
+            continue
+        p = r + nonzero[0]
+        if p != r:
+            M[[r, p]] = M[[p, r]]
+        M[r] = (M[r] * inv[M[r, c]]) % q
+        M[r+1:] = (M[r+1:] - np.outer(M[r+1:, c], M[r])) % q
+        r += 1
+    return r
+
+def is_invertible(M, q):
+    rows, cols = np.shape(M)
+    return rows == cols and rank(M, q) == rows
+
+def systematic_form(G, q, overwrite = False):
+    """
+    Systematic form [I_k | V] of the k x n matrix G over GF(q), computed
+    with a single Gauss-Jordan elimination on the first k columns.
+    Returns None as soon as G[:, :k] turns out to be singular.
+    With `overwrite` the elimination is done in place on G (an int64 array
+    with entries in range(q)).
+    """
+    M = G if overwrite else np.array(G, dtype = np.int64) % q
+    k = M.shape[0]
+    inv = inverse_table(q)
+    for c in range(k):
+        nonzero = np.flatnonzero(M[c:, c])
+        if not len(nonzero):
+            return None
+        p = c + nonzero[0]
+        if p != c:
+            M[[c, p]] = M[[p, c]]
+        # columns before c are already reduced, work on the right block only
+        row = (M[c, c:] * inv[M[c, c]]) % q
+        M[c, c:] = row
+        col = M[:, c].copy()
+        col[c] = 0
+        M[:, c:] -= np.outer(col, row)
+        M[:, c:] %= q
+    return M
+
+def inverse(M, q):
+    """
+    Inverse of the square matrix M over GF(q), None if M is singular.
+    """
+    n = M.shape[0]
+    aug = np.concatenate([np.array(M, dtype = np.int64) % q, np.eye(n, dtype = np.int64)], axis = 1)
+    sf = systematic_form(aug, q, overwrite = True)
+    if sf is None:
+        return None
+    return sf[:, n:]